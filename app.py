@@ -1,15 +1,15 @@
-from flask import Flask, render_template, request, jsonify
-from policy_analyzer import PolicyAnalyzer
-from use_case_analyzer import UseCaseAnalyzer
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, url_for, g
+from llm_client import LLMClient
+import metrics
+from jobs import JobManager, JobStore, JobQueueFull
 import os
-from werkzeug.utils import secure_filename
-from utils import load_documents
 import tempfile
 import logging
-from pathlib import Path
 import time
-from datetime import datetime, timedelta
-import glob
+import json
+import io
+import shutil
+import threading
 
 # Configure logging with more detailed format
 logging.basicConfig(
@@ -19,66 +19,257 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
+app.config['BATCH_MAX_ITEMS'] = 50
+# Uploads queued for a background job are kept in memory up to this size,
+# larger ones are copied to per-request scratch files
+app.config['UPLOAD_MEMORY_LIMIT'] = int(os.getenv('UPLOAD_MEMORY_LIMIT', str(4 * 1024 * 1024)))
 
-# Ensure upload directory exists and is writable
-upload_dir = Path(app.config['UPLOAD_FOLDER'])
-upload_dir.mkdir(exist_ok=True)
-if not os.access(upload_dir, os.W_OK):
-    logger.error(f"Upload directory {upload_dir} is not writable!")
+# Pooled, rate-limited LLM client shared by both analyzers
+llm_client = LLMClient(os.getenv('OPENROUTER_API_KEY'))
 
-# Initialize analyzers
-policy_analyzer = PolicyAnalyzer(os.getenv('OPENROUTER_API_KEY'))
-use_case_analyzer = UseCaseAnalyzer(os.getenv('OPENROUTER_API_KEY'))
+# Background analysis jobs, recorded in SQLite so any worker can report on them
+job_manager = JobManager(JobStore(os.getenv('JOBS_DB_PATH', os.path.join('.cache', 'jobs.sqlite3'))))
 
-# Initialize databases
-policy_analyzer.initialize_databases(
-    internal_path="data/internal",
-    global_path="data/global"
-)
-use_case_analyzer.set_internal_db(policy_analyzer.internal_db)
+# The analyzers pull in langchain, FAISS and the embedding model, and their
+# indexes take a while to load, so they are set up in a background thread
+# and the server starts listening right away
+policy_analyzer = None
+use_case_analyzer = None
+readiness = {'status': 'starting', 'error': None, 'started_at': time.time(), 'ready_at': None}
+
+# Endpoints that answer before the indexes are loaded
+ALWAYS_AVAILABLE = {'index', 'static', 'healthz', 'readyz', 'metrics_endpoint', 'get_job'}
+
+def warm_up():
+    """Import the analysis stack, load both indexes and mark the app ready"""
+    global policy_analyzer, use_case_analyzer
+    try:
+        from policy_analyzer import PolicyAnalyzer
+        from use_case_analyzer import UseCaseAnalyzer
+        from utils import index_version, load_sparse_index, load_catalog
+        
+        policy = PolicyAnalyzer(os.getenv('OPENROUTER_API_KEY'), llm_client=llm_client)
+        use_case = UseCaseAnalyzer(os.getenv('OPENROUTER_API_KEY'), llm_client=llm_client)
+        policy.initialize_databases(
+            internal_path="data/internal",
+            global_path="data/global"
+        )
+        use_case.set_internal_db(
+            policy.internal_db, index_version("private_db"), load_sparse_index("private_db"),
+            load_catalog("private_db")
+        )
+        
+        policy_analyzer, use_case_analyzer = policy, use_case
+        readiness['ready_at'] = time.time()
+        readiness['status'] = 'ready'
+        logger.info(f"Indexes loaded in {readiness['ready_at'] - readiness['started_at']:.1f}s")
+    except Exception as e:
+        readiness['status'] = 'failed'
+        readiness['error'] = str(e)
+        logger.error(f"Error loading indexes: {str(e)}")
+
+# PDF parsing workers are spawned processes that re-import this script as
+# __mp_main__; only the server itself loads the indexes
+if __name__ != '__mp_main__':
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+@app.before_request
+def start_timer():
+    """Start timing the request and collecting its stage timings"""
+    g.request_start = time.perf_counter()
+    metrics.start_request()
+
+def finish_request(status):
+    """Count the request and record its latency and stage timings"""
+    endpoint = request.endpoint or 'unknown'
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    metrics.requests_total.inc(endpoint=endpoint, status=status)
+    metrics.request_seconds.observe(elapsed, endpoint=endpoint)
+    if metrics.METRICS_LOG and endpoint not in ('static', 'metrics_endpoint'):
+        stages = {stage: round(seconds, 4) for stage, seconds in metrics.request_stages().items()}
+        logger.info(metrics.log_line(
+            event='request', method=request.method, endpoint=endpoint,
+            status=status, duration=round(elapsed, 4), stages=stages
+        ))
+
+@app.after_request
+def record_request(response):
+    """Record the request, unless it streams events (recorded once the stream ends)"""
+    if not g.get('streaming'):
+        finish_request(response.status_code)
+    return response
+
+@app.before_request
+def require_ready():
+    """Answer 503 until the indexes are loaded"""
+    if request.endpoint in ALWAYS_AVAILABLE or readiness['status'] == 'ready':
+        return None
+    if readiness['status'] == 'failed':
+        return jsonify({'error': 'Service failed to load its indexes'}), 503
+    return jsonify({'error': 'Service is starting, indexes are still loading'}), 503, {'Retry-After': '10'}
 
 def allowed_file(filename):
     """Check if the file has an allowed extension"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def cleanup_old_files():
-    """Remove files older than 1 hour from the upload directory"""
+def open_upload(file):
+    """Return the upload as a seekable binary stream, parsed without touching disk
+    
+    Werkzeug keeps small uploads in memory and spools large ones to a temporary
+    file it deletes when the request ends
+    """
+    file.stream.seek(0)
+    return file.stream
+
+def detach_upload(file):
+    """Make an upload readable after the request ends, for background jobs
+    
+    Returns the document (bytes buffer or scratch file path) and a cleanup callback
+    """
+    stream = open_upload(file)
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size <= app.config['UPLOAD_MEMORY_LIMIT']:
+        return io.BytesIO(stream.read()), None
+    
+    fd, filepath = tempfile.mkstemp(prefix='upload-', suffix='.pdf')
     try:
-        one_hour_ago = datetime.now() - timedelta(hours=1)
-        for file_path in glob.glob(os.path.join(app.config['UPLOAD_FOLDER'], '*')):
-            if os.path.getmtime(file_path) < one_hour_ago.timestamp():
-                os.remove(file_path)
-                logger.info(f"Removed old file: {file_path}")
-    except Exception as e:
-        logger.error(f"Error cleaning up old files: {str(e)}")
+        with os.fdopen(fd, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+    except Exception:
+        remove_file(filepath)
+        raise
+    return filepath, lambda: remove_file(filepath)
+
+def remove_file(filepath):
+    """Delete a file if it still exists"""
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+def wants_async():
+    """Whether the client asked for a job id instead of waiting for the result"""
+    payload = request.get_json(silent=True) if request.is_json else None
+    return (request.form.get('async') == 'true'
+            or (isinstance(payload, dict) and payload.get('async') is True)
+            or 'respond-async' in request.headers.get('Prefer', ''))
+
+def batch_input(key):
+    """Read a list input from a JSON body or from repeated form fields"""
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        values = payload.get(key) or []
+        language = payload.get('language', 'en')
+    else:
+        values = request.form.getlist(key)
+        language = request.form.get('language', 'en')
+    return [value for value in values if isinstance(value, str) and value.strip()], language
+
+class InvalidFilters(ValueError):
+    """Raised when a request's retrieval filters are malformed (answered with 400)"""
+    pass
+
+def search_filters():
+    """
+    Read the retrieval filters of a request: filter_source, filter_language and
+    filter_family form fields (repeatable) or a "filters" object in a JSON body
+    Returns None when the search is not restricted; raises InvalidFilters for
+    unknown keys or values that are not strings or lists of strings
+    """
+    from partitions import FILTER_KEYS, normalize_filters
+    try:
+        if request.is_json:
+            payload = request.get_json(silent=True)
+            return normalize_filters(payload.get('filters') if isinstance(payload, dict) else None)
+        return normalize_filters({key: request.form.getlist(f'filter_{key}') for key in FILTER_KEYS})
+    except ValueError as e:
+        raise InvalidFilters(str(e)) from e
+
+def enqueue_job(kind, fn, *args, cleanup=None):
+    """Queue an analysis and answer 202 with the job id, or 503 if the queue is full"""
+    try:
+        job_id = job_manager.submit(kind, fn, *args, cleanup=cleanup)
+    except JobQueueFull as e:
+        if cleanup:
+            cleanup()
+        logger.warning(f"Rejected {kind} job: {str(e)}")
+        return jsonify({'error': 'Too many pending analyses, please retry later'}), 503, {'Retry-After': '30'}
+    
+    status_url = url_for('get_job', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': status_url}), 202, {'Location': status_url}
+
+def sse_event(event, data):
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events, cleanup=None):
+    """Relay analyzer (event, payload) pairs to the client as Server-Sent Events
+    
+    The analysis runs as the events are sent, so the request is recorded, with
+    its stage timings, when the stream ends
+    """
+    def generate():
+        try:
+            for event, payload in events:
+                if event == "token":
+                    yield sse_event("token", {"text": payload})
+                elif event == "done":
+                    yield sse_event("done", payload)
+                else:
+                    yield sse_event("error", {"error": payload})
+        finally:
+            if cleanup:
+                cleanup()
+            finish_request(200)
+    
+    g.streaming = True
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: the indexes are loaded and analyses can be served"""
+    body = {'status': readiness['status']}
+    if readiness['error']:
+        body['error'] = readiness['error']
+    if readiness['ready_at']:
+        body['startup_seconds'] = round(readiness['ready_at'] - readiness['started_at'], 3)
+    return jsonify(body), 200 if readiness['status'] == 'ready' else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     try:
         language = request.form.get('language', 'en')
+        filters = search_filters()
         
         # Handle file upload
         if 'file' in request.files:
             file = request.files['file']
             if file and file.filename.endswith('.pdf'):
-                # Save the file temporarily
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                
-                # Analyze the policy
-                result = policy_analyzer.analyze_new_policy(filepath, language)
+                if wants_async():
+                    document, cleanup = detach_upload(file)
+                    return enqueue_job('policy', policy_analyzer.analyze_new_policy, document, language, filters,
+                                       cleanup=cleanup)
                 
-                # Clean up
-                os.remove(filepath)
+                # Analyze the policy straight from the upload stream
+                result = policy_analyzer.analyze_new_policy(open_upload(file), language, filters)
                 
                 if result:
                     return jsonify(result)
@@ -91,7 +282,11 @@ def analyze():
         elif 'policy_text' in request.form:
             policy_text = request.form.get('policy_text')
             if policy_text:
-                result = policy_analyzer.analyze_new_policy_from_text(policy_text, language)
+                if wants_async():
+                    return enqueue_job('policy', policy_analyzer.analyze_new_policy_from_text, policy_text, language,
+                                       filters)
+                
+                result = policy_analyzer.analyze_new_policy_from_text(policy_text, language, filters)
                 if result:
                     return jsonify(result)
                 else:
@@ -101,6 +296,8 @@ def analyze():
         
         return jsonify({'error': 'No valid input provided'}), 400
         
+    except InvalidFilters as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in analyze endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -111,22 +308,171 @@ def analyze_usecase():
         language = request.form.get('language', 'en')
         use_case = request.form.get('use_case')
         is_cis = request.form.get('is_cis') == 'true'
+        filters = search_filters()
         
         if not use_case:
             return jsonify({'error': 'No use case provided'}), 400
             
+        if wants_async():
+            return enqueue_job('usecase', use_case_analyzer.analyze_use_case, use_case, language, filters)
+            
         # Analyze the use case
-        result = use_case_analyzer.analyze_use_case(use_case, language)
+        result = use_case_analyzer.analyze_use_case(use_case, language, filters)
         if result:
             return jsonify(result)
         else:
             return jsonify({'error': 'Failed to analyze use case'}), 500
             
+    except InvalidFilters as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in analyze-usecase endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    try:
+        language = request.form.get('language', 'en')
+        filters = search_filters()
+        
+        # Handle file upload
+        if 'file' in request.files:
+            file = request.files['file']
+            if file and file.filename.endswith('.pdf'):
+                # The request, and with it the upload, stays open while the response streams
+                return sse_response(policy_analyzer.stream_new_policy(open_upload(file), language, filters))
+            else:
+                return jsonify({'error': 'Invalid file type'}), 400
+        
+        # Handle text input
+        elif 'policy_text' in request.form:
+            policy_text = request.form.get('policy_text')
+            if policy_text:
+                return sse_response(policy_analyzer.stream_new_policy_from_text(policy_text, language, filters))
+            else:
+                return jsonify({'error': 'No policy text provided'}), 400
+        
+        return jsonify({'error': 'No valid input provided'}), 400
+        
+    except InvalidFilters as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in analyze stream endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analyze-usecase/stream', methods=['POST'])
+def analyze_usecase_stream():
+    try:
+        language = request.form.get('language', 'en')
+        use_case = request.form.get('use_case')
+        filters = search_filters()
+        
+        if not use_case:
+            return jsonify({'error': 'No use case provided'}), 400
+        
+        return sse_response(use_case_analyzer.stream_use_case(use_case, language, filters))
+            
+    except InvalidFilters as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in analyze-usecase stream endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def summarize_policy_batch(reports, labels):
+    """Per-item results and totals for a policy batch"""
+    items = [
+        {"input": label, "result": report, "status": "completed" if report else "failed"}
+        for label, report in zip(labels, reports)
+    ]
+    completed = sum(1 for item in items if item["result"])
+    return {"items": items, "summary": {"total": len(items), "completed": completed, "failed": len(items) - completed}}
+
+def analyze_policy_batch(texts, labels, language, filters=None):
+    """Analyze a batch of policy texts and summarize the outcome"""
+    return summarize_policy_batch(policy_analyzer.analyze_policies(texts, language, filters), labels)
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    try:
+        texts, language = batch_input('policy_texts')
+        filters = search_filters()
+        labels = [f"text:{i + 1}" for i in range(len(texts))]
+        
+        # Uploaded PDFs are read up front so jobs only carry their text
+        for file in request.files.getlist('files'):
+            if not (file and file.filename.endswith('.pdf')):
+                return jsonify({'error': f'Invalid file type: {file.filename}'}), 400
+            policy_text = policy_analyzer._load_policy_text(open_upload(file))
+            if policy_text is None:
+                return jsonify({'error': f'Failed to read {file.filename}'}), 400
+            texts.append(policy_text)
+            labels.append(file.filename)
+        
+        if not texts:
+            return jsonify({'error': 'No policies provided'}), 400
+        if len(texts) > app.config['BATCH_MAX_ITEMS']:
+            return jsonify({'error': f"At most {app.config['BATCH_MAX_ITEMS']} items per batch"}), 400
+        
+        if wants_async():
+            return enqueue_job('policy-batch', analyze_policy_batch, texts, labels, language, filters)
+        return jsonify(analyze_policy_batch(texts, labels, language, filters))
+        
+    except InvalidFilters as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in analyze batch endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/analyze-usecase/batch', methods=['POST'])
+def analyze_usecase_batch():
+    try:
+        use_cases, language = batch_input('use_cases')
+        control_ids, _ = batch_input('control_ids')
+        use_cases = control_ids + use_cases
+        filters = search_filters()
+        
+        if not use_cases:
+            return jsonify({'error': 'No use cases provided'}), 400
+        if len(use_cases) > app.config['BATCH_MAX_ITEMS']:
+            return jsonify({'error': f"At most {app.config['BATCH_MAX_ITEMS']} items per batch"}), 400
+        
+        if wants_async():
+            return enqueue_job('usecase-batch', use_case_analyzer.analyze_use_cases, use_cases, language, filters)
+        return jsonify(use_case_analyzer.analyze_use_cases(use_cases, language, filters))
+        
+    except InvalidFilters as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in analyze-usecase batch endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/coverage', methods=['GET'])
+def coverage():
+    try:
+        source = request.args.get('source')
+        threshold = request.args.get('threshold', type=float)
+        uncovered_only = request.args.get('uncovered') == 'true'
+        
+        kwargs = {'source': source, 'uncovered_only': uncovered_only}
+        if threshold is not None:
+            kwargs['threshold'] = threshold
+        return jsonify(policy_analyzer.coverage_report(**kwargs))
+        
+    except Exception as e:
+        logger.error(f"Error in coverage endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
+        
+    except Exception as e:
+        logger.error(f"Error in jobs endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
-    # Clean up old files before starting
-    cleanup_old_files()
     app.run(debug=True) 
\ No newline at end of file
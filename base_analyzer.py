@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
+from cache import get_response_cache, normalize_query, response_key
+from llm_client import API_URL, LLM_MODEL, LLMClient
+import metrics
+
+# Token budget of a prompt: model context minus room for the response
+MODEL_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "8192"))
+RESPONSE_TOKENS = int(os.getenv("LLM_RESPONSE_TOKENS", "1500"))
+PROMPT_TOKENS = MODEL_CONTEXT_TOKENS - RESPONSE_TOKENS
+
+# Maximum number of analyses of one batch request running at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+def unique_items(items):
+    """Drop duplicates (ignoring case and whitespace), keeping the first occurrence"""
+    seen = set()
+    unique = []
+    for item in items:
+        key = normalize_query(item)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+class BaseAnalyzer:
+    """LLM plumbing shared by the policy and use case analyzers"""
+    def __init__(self, api_key, response_cache=None, llm_client=None, api_url=API_URL, model=LLM_MODEL):
+        if llm_client is None:
+            llm_client = LLMClient(api_key, api_url=api_url, model=model)
+        self.llm_client = llm_client
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
+
+    def query_llm(self, prompt, language='en'):
+        """Query the LLM through OpenRouter API"""
+        try:
+            return self.llm_client.complete(prompt)
+        except Exception as e:
+            print(f"Error querying LLM: {str(e)}")
+            return None
+
+    def _analyze_batch(self, items, analyze_one):
+        """Run analyze_one over the distinct items with bounded concurrency
+        
+        Returns the results in the order of items, duplicates sharing a result.
+        """
+        unique = unique_items(items)
+        
+        def safe_analyze(item):
+            try:
+                return analyze_one(item)
+            except Exception as e:
+                print(f"Error in batch analysis: {str(e)}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+            results = dict(zip(
+                (normalize_query(item) for item in unique),
+                executor.map(metrics.bind(safe_analyze), unique)
+            ))
+        return [results[normalize_query(item)] for item in items]
+
+    def _run_analysis(self, prompt, language='en'):
+        """Get the analysis report for a prompt, from the response cache when possible"""
+        key = response_key(self.llm_client.model, prompt)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        # Get analysis from LLM
+        llm_response = self.query_llm(prompt, language)
+        report = self._format_analysis_report(llm_response)
+        if report:
+            self.response_cache.set(key, report)
+        return report
+
+    def _stream_analysis(self, prompt, language='en'):
+        """Stream the analysis for a prompt
+        
+        Yields ("token", text) events as the completion arrives, then either
+        ("done", report) or ("error", message). Cached reports are replayed
+        as a single token.
+        """
+        key = response_key(self.llm_client.model, prompt)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            yield "token", cached["analysis"]
+            yield "done", cached
+            return
+        
+        parts = []
+        try:
+            for text in self.llm_client.stream(prompt):
+                parts.append(text)
+                yield "token", text
+        except Exception as e:
+            print(f"Error streaming from LLM: {str(e)}")
+            yield "error", "Failed to get analysis from the language model"
+            return
+        
+        report = self._format_analysis_report("".join(parts))
+        if not report:
+            yield "error", "The language model returned an empty analysis"
+            return
+        self.response_cache.set(key, report)
+        yield "done", report
+
+    def _format_analysis_report(self, llm_response):
+        """Format the analysis report in a structured way"""
+        if not llm_response:
+            return None
+            
+        return {
+            "analysis": llm_response,
+            "timestamp": datetime.now().isoformat(),
+            "status": "completed"
+        }
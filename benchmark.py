@@ -0,0 +1,378 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import llm_stub_server
+
+# Corpus the synthetic one is derived from
+SOURCE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+COLLECTIONS = {"internal": "private_db", "global": "public_db"}
+
+def rss_peak_mb():
+    """Peak resident memory of this process and its finished children, in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"self": round(own / unit, 1), "children": round(children / unit, 1)}
+
+def latency_summary(samples):
+    """Percentiles of a list of latencies, in milliseconds"""
+    ms = np.asarray(samples, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"count": 0}
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- Synthetic corpus -------------------------------------------------------
+
+def _pdf_escape(line):
+    line = line.encode("latin-1", "replace").decode("latin-1")
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_text_pdf(path, pages, width=95, lines_per_page=60):
+    """
+    Writes a minimal PDF (Helvetica, one text block per page) so the synthetic
+    corpus goes through the same pypdf extraction as the real one
+    """
+    streams = []
+    for text in pages:
+        lines = []
+        for paragraph in text.splitlines():
+            words = paragraph.split()
+            current = ""
+            for word in words:
+                if current and len(current) + len(word) + 1 > width:
+                    lines.append(current)
+                    current = word
+                else:
+                    current = f"{current} {word}".strip()
+            if current:
+                lines.append(current)
+        body = " T*\n".join(f"({_pdf_escape(line)}) Tj" for line in lines[:lines_per_page])
+        streams.append(f"BT /F1 10 Tf 12 TL 40 760 Td\n{body}\nET".encode("latin-1"))
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for stream in streams:
+        content_id = len(objects) + 1
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(len(objects) + 1)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def build_corpus(workdir, scale, seed=0):
+    """
+    Creates data/internal and data/global under workdir at scale times the
+    size of the bundled corpus: the original PDFs plus (scale - 1) variants
+    of each whose pages have their sentences shuffled (deterministic per seed)
+    """
+    from pdf_extraction import extract_pages
+
+    rng = random.Random(seed)
+    for collection in COLLECTIONS:
+        source_dir = os.path.join(SOURCE_DATA, collection)
+        target_dir = os.path.join(workdir, "data", collection)
+        os.makedirs(target_dir, exist_ok=True)
+        fnames = sorted(f for f in os.listdir(source_dir) if f.endswith(".pdf"))
+        for fname in fnames:
+            shutil.copy(os.path.join(source_dir, fname), target_dir)
+        if scale <= 1:
+            continue
+
+        extracted = extract_pages([os.path.join(source_dir, f) for f in fnames])
+        for fname in fnames:
+            pages = extracted.get(os.path.join(source_dir, fname), [])
+            for replica in range(1, scale):
+                variant = []
+                for text in pages:
+                    sentences = re.split(r"(?<=[.;:])\s+", text)
+                    rng.shuffle(sentences)
+                    variant.append("\n".join(sentences))
+                write_text_pdf(os.path.join(target_dir, f"synthetic-{replica:03d}-{fname}"), variant)
+
+# --- Benchmarks -------------------------------------------------------------
+
+def bench_ingestion(directories):
+    """Cold PDF parsing throughput, then the same pass served from the text cache"""
+    import pdf_extraction
+
+    paths = [os.path.join(d, f) for d in directories for f in sorted(os.listdir(d)) if f.endswith(".pdf")]
+    pdf_extraction.PDF_CACHE_DIR = tempfile.mkdtemp(prefix="pdf-cache-", dir=".")
+
+    start = time.perf_counter()
+    extracted = pdf_extraction.extract_pages(paths)
+    cold = time.perf_counter() - start
+    pages = sum(len(p) for p in extracted.values())
+
+    start = time.perf_counter()
+    pdf_extraction.extract_pages(paths)
+    cached = time.perf_counter() - start
+
+    return {
+        "files": len(paths),
+        "pages": pages,
+        "workers": pdf_extraction.INGEST_WORKERS,
+        "cold_seconds": round(cold, 3),
+        "pages_per_second": round(pages / cold, 1) if cold else None,
+        "cached_seconds": round(cached, 3),
+        "rss_peak_mb": rss_peak_mb(),
+    }
+
+def bench_build(directory, db_name, embedding_service):
+    """Chunking, embedding and index build time of one store"""
+    from langchain_community.vectorstores import FAISS
+    import utils
+
+    docs = utils.load_documents(directory)
+    start = time.perf_counter()
+    split_docs, ids = utils.split_documents(docs)
+    split_seconds = time.perf_counter() - start
+
+    texts = [doc.page_content for doc in split_docs]
+    start = time.perf_counter()
+    vectors = embedding_service.embed(texts)
+    embed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectordb = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())), embedding_service,
+        metadatas=[doc.metadata for doc in split_docs], ids=ids
+    )
+    os.makedirs(utils.VECTORSTORE_DIR, exist_ok=True)
+    utils.save_vector_store(vectordb, db_name)
+    index_seconds = time.perf_counter() - start
+
+    # Same manifest update_vector_store writes, so the app loads this store as is
+    manifest = utils.build_manifest(directory)
+    utils.record_files(manifest["files"], docs, split_docs, ids)
+    utils.save_manifest(db_name, manifest)
+
+    return {
+        "pages": len(docs),
+        "chunks": len(texts),
+        "split_seconds": round(split_seconds, 3),
+        "embed_seconds": round(embed_seconds, 3),
+        "chunks_per_second": round(len(texts) / embed_seconds, 1) if embed_seconds else None,
+        "index_build_seconds": round(index_seconds, 3),
+        "index_type": utils.INDEX_TYPE,
+        "rss_peak_mb": rss_peak_mb(),
+    }
+
+def sample_queries(vectordb, count, seed=0):
+    """Short queries made of the opening words of random chunks"""
+    rng = random.Random(seed)
+    ids = list(vectordb.index_to_docstore_id.values())
+    queries = []
+    for chunk_id in rng.sample(ids, min(count, len(ids))):
+        words = vectordb.docstore.search(chunk_id).page_content.split()
+        start = rng.randrange(max(len(words) - 12, 1))
+        queries.append(" ".join(words[start:start + 12]))
+    while len(queries) < count:
+        queries.append(queries[len(queries) % len(ids)])
+    return queries
+
+def bench_queries(db_name, queries, ks, concurrencies):
+    """Uncached retrieval latency per mode, k and number of concurrent clients"""
+    import utils
+    from embeddings import query_embedding_cache
+    from retrieval import Retriever, search_cache
+
+    vectordb = utils.load_vector_store(db_name)
+    sparse_index = utils.load_sparse_index(db_name)
+    retrievers = {"dense": Retriever(vectordb, "bench-dense")}
+    if sparse_index is not None:
+        retrievers["hybrid"] = Retriever(vectordb, "bench-hybrid", sparse_index)
+
+    results = []
+    for mode, retriever in retrievers.items():
+        for k in ks:
+            for concurrency in concurrencies:
+                search_cache.clear()
+                query_embedding_cache.clear()
+
+                def timed_search(query):
+                    start = time.perf_counter()
+                    retriever.similarity_search(query, k=k)
+                    return time.perf_counter() - start
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    latencies = list(executor.map(timed_search, queries))
+                wall = time.perf_counter() - start
+                results.append({
+                    "mode": mode, "k": k, "concurrency": concurrency,
+                    "queries_per_second": round(len(queries) / wall, 1),
+                    **latency_summary(latencies),
+                })
+    return results
+
+def bench_endpoints(requests_per_endpoint, concurrency, llm_latency, llm_tokens_per_second, queries):
+    """
+    Latency of the analysis endpoints through the Flask app with the LLM
+    replaced by llm_stub_server, so the numbers show this service's own overhead
+    """
+    server = llm_stub_server.start_server(latency=llm_latency, tokens_per_second=llm_tokens_per_second)
+
+    os.environ["LLM_CACHE"] = "none"
+    os.environ["LLM_API_URL"] = server.url
+    start = time.perf_counter()
+    import app as webapp
+    while webapp.readiness["status"] == "starting":
+        time.sleep(0.05)
+    startup = {"status": webapp.readiness["status"], "ready_seconds": round(time.perf_counter() - start, 3)}
+
+    endpoints = {
+        "/analyze-usecase": lambda i: {"use_case": queries[i % len(queries)], "language": "en"},
+        "/analyze": lambda i: {"policy_text": queries[i % len(queries)], "language": "en"},
+    }
+    results = {}
+    for path, form in endpoints.items():
+        def call(i):
+            client = webapp.app.test_client()
+            start = time.perf_counter()
+            response = client.post(path, data=form(i))
+            return time.perf_counter() - start, response.status_code
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(call, range(requests_per_endpoint)))
+        results[path] = {
+            "concurrency": concurrency,
+            "errors": sum(1 for _, status in outcomes if status != 200),
+            **latency_summary([latency for latency, _ in outcomes]),
+        }
+
+    server.shutdown()
+    server.server_close()
+    return {
+        "startup": startup,
+        "llm_stub": {"latency_seconds": llm_latency, "tokens_per_second": llm_tokens_per_second,
+                     "requests": server.requests},
+        "endpoints": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, indexing, retrieval and the analysis endpoints")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Corpus size as a multiple of data/ (e.g. 10 or 100)")
+    parser.add_argument("--workdir", help="Directory for the corpus and indexes (default: a temporary one)")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per retrieval configuration")
+    parser.add_argument("--k", default="4,10,20", help="Comma-separated k values")
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Stub LLM response delay in seconds")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0,
+                        help="Stub LLM generation speed, 0 for instant")
+    parser.add_argument("--skip-endpoints", action="store_true", help="Skip the end-to-end endpoint benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ks = [int(k) for k in args.k.split(",")]
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="satim-bench-"))
+    output = os.path.abspath(args.output) if args.output else None
+    os.makedirs(workdir, exist_ok=True)
+    # Indexes, caches and the app all resolve their paths from the working directory
+    os.chdir(workdir)
+
+    import utils
+    from embeddings import get_embedding_service
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "workdir": workdir,
+        "index_config": utils.index_config(),
+    }
+
+    print(f"Generating corpus at {args.scale}x in {workdir}")
+    start = time.perf_counter()
+    build_corpus(workdir, args.scale, args.seed)
+    results["corpus_seconds"] = round(time.perf_counter() - start, 3)
+
+    directories = [os.path.join("data", collection) for collection in COLLECTIONS]
+    print("Benchmarking ingestion")
+    results["ingestion"] = bench_ingestion(directories)
+
+    start = time.perf_counter()
+    embedding_service = get_embedding_service()
+    results["model_load_seconds"] = round(time.perf_counter() - start, 3)
+
+    print("Benchmarking index builds")
+    results["build"] = {
+        db_name: bench_build(os.path.join("data", collection), db_name, embedding_service)
+        for collection, db_name in COLLECTIONS.items()
+    }
+
+    print("Benchmarking retrieval")
+    queries = sample_queries(utils.load_vector_store("private_db"), args.queries, args.seed)
+    results["retrieval"] = bench_queries("public_db", queries, ks, concurrencies)
+
+    if not args.skip_endpoints:
+        print("Benchmarking endpoints")
+        results["endpoints"] = bench_endpoints(
+            args.requests, max(concurrencies), args.llm_latency, args.llm_tokens_per_second, queries)
+
+    results["rss_peak_mb"] = rss_peak_mb()
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written to {output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
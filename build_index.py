@@ -0,0 +1,31 @@
+import argparse
+from utils import update_vector_store, update_coverage_index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Incrementally index the internal and global policy corpora"
+    )
+    parser.add_argument("--internal", default="data/internal",
+                        help="Directory containing the internal policy PDFs")
+    parser.add_argument("--global", dest="global_path", default="data/global",
+                        help="Directory containing the global regulation PDFs")
+    parser.add_argument("--only", choices=["internal", "global"],
+                        help="Only update one of the two stores")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Re-embed every document instead of only new or modified ones")
+    args = parser.parse_args()
+    
+    internal_db = global_db = None
+    if args.only != "global":
+        internal_db = update_vector_store(args.internal, is_public=False, rebuild=args.rebuild)
+    if args.only != "internal":
+        global_db = update_vector_store(args.global_path, is_public=True, rebuild=args.rebuild)
+    
+    # Precompute which global requirements the internal policies cover
+    if internal_db is not None and global_db is not None:
+        update_coverage_index(global_db, internal_db)
+
+
+if __name__ == "__main__":
+    main()
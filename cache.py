@@ -0,0 +1,217 @@
+# cache.py
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import metrics
+
+def normalize_query(text):
+    """
+    Normalizes query text for use in cache keys: lowercase, collapsed whitespace
+    """
+    return re.sub(r'\s+', ' ', text or '').strip().lower()
+
+def estimate_size(value):
+    """
+    Rough size in bytes of a cached value (NumPy arrays, strings, documents, lists)
+    """
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (str, bytes)):
+        return sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if hasattr(value, "page_content"):
+        return sys.getsizeof(value.page_content) + sys.getsizeof(str(value.metadata))
+    return sys.getsizeof(value)
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and total size
+    """
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, sizeof=estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value or None, updating the hit/miss counters"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Stores a value, evicting least recently used entries to stay in bounds"""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns hit/miss counters and current occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+def response_key(model, prompt):
+    """
+    Fingerprint of an LLM request: hash of the model name and the formatted prompt
+    """
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Interface for LLM response caches; this base implementation stores nothing
+    """
+    def get(self, key):
+        """Returns the stored response for the key, or None"""
+        return None
+
+    def set(self, key, value):
+        """Stores a JSON-serializable response under the key"""
+        pass
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    On-disk response cache shared by every worker process on the host
+    Entries expire after ttl seconds; beyond max_entries the least recently
+    used ones are evicted
+    """
+    def __init__(self, path, ttl=24 * 3600, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection committed when the block succeeds and closed in any case"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value FROM responses WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"Error reading response cache: {str(e)}")
+            row = None
+        
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing response cache: {str(e)}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """
+    Returns the process-wide LLM response cache configured through the
+    environment: LLM_CACHE ("sqlite" or "none"), LLM_CACHE_PATH,
+    LLM_CACHE_TTL (seconds) and LLM_CACHE_MAX_ENTRIES
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            if os.getenv("LLM_CACHE", "sqlite").lower() == "none":
+                _response_cache = ResponseCache()
+            else:
+                _response_cache = SQLiteResponseCache(
+                    os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3")),
+                    ttl=float(os.getenv("LLM_CACHE_TTL", str(24 * 3600))),
+                    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+                )
+            metrics.register_cache("llm_response", _response_cache)
+        return _response_cache
@@ -0,0 +1,197 @@
+# chunking.py
+
+import os
+import re
+from collections import Counter
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Longest chunk in characters; MiniLM only reads its first 256 tokens anyway
+STRUCTURE_MAX_CHARS = int(os.getenv("STRUCTURE_MAX_CHARS", "1000"))
+# Title/chapter headings shorter than this are merged into the unit they open
+PREFIX_MAX_CHARS = 300
+# Lines repeated at the top or bottom of at least this share of pages are headers/footers
+REPEATED_LINE_SHARE = 0.5
+# Lines per page edge checked for headers and footers
+EDGE_LINES = 2
+
+# "Article 1er. —", "Art. 38 :"
+ARTICLE = re.compile(r"^(?:Article|Art\.)\s*(\d+)\s*(?:er|ère|bis|ter)?\s*[.:—–-]")
+# "TITRE I", "Chapitre 2", "Annexe", a law's title: headings that don't name a unit
+GROUP = re.compile(
+    r"^(?:TITRE|Titre|CHAPITRE|Chapitre|SECTION|Section)\s+(?:[IVXLC]+|\d+)(?:er)?\b"
+    r"|^(?:Loi|Décret|Ordonnance)\s+n°|^(?:ANNEXE|Annexe)\b"
+)
+# "14.5.2.2 Contrôle des transactions", "11 Gestion des risques", "4. SEPARATION OF DUTIES"
+SECTION = re.compile(
+    r"^(\d{1,2}(?:\.\d{1,2}){1,4})\.?\s+(?=[A-ZÀ-Ý])"
+    r"|^(\d{1,2})\s+(?=[A-ZÀ-Ý][a-zà-ÿ])"
+    r"|^(\d{1,2})\.\s+(?=[A-Z]{2,}\b)"
+)
+# Numbered controls, lettered items and bullets: places to split long units
+ITEM = re.compile(r"^(?:\d{1,2}|[a-z])[.)]\s+\S|^[•▪◦\uf0b7\-–]\s")
+# Table of contents entries ("3 Cadre normatif ....... 11") and bare page numbers
+TOC_LINE = re.compile(r"(?:\.\s*){5,}\d+\s*$")
+# Pages with at least this share of table of contents lines are dropped whole
+TOC_PAGE_SHARE = 0.3
+PAGE_NUMBER = re.compile(r"^(?:page\s*)?\d+(?:\s*(?:sur|of|/)\s*\d+)?$", re.IGNORECASE)
+
+def reflow(text):
+    """
+    Rejoins text extracted one word per line (as from PDFs printed from Word):
+    words separated by a single blank line form a line, longer gaps end it
+    Other text is returned unchanged
+    """
+    lines = text.split("\n")
+    filled = [line for line in lines if line.strip()]
+    if not filled or sum(len(line.split()) <= 1 for line in filled) < 0.8 * len(filled):
+        return text
+
+    out = []
+    current = []
+    blanks = 0
+    for line in lines:
+        if not line.strip():
+            blanks += 1
+            continue
+        if blanks >= 2 and current:
+            out.append(" ".join(current))
+            current = []
+        current.append(line.strip())
+        blanks = 0
+    if current:
+        out.append(" ".join(current))
+    return "\n".join(out)
+
+def _edge_key(line):
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+def _edges(lines):
+    filled = [line for line in lines if line.strip()]
+    return filled[:EDGE_LINES] + filled[-EDGE_LINES:]
+
+def repeated_edge_lines(pages):
+    """
+    Header and footer lines: the first/last lines of a page that recur, up to
+    their numbers, on at least REPEATED_LINE_SHARE of the pages
+    """
+    if len(pages) < 3:
+        return set()
+    counts = Counter(key for lines in pages for key in {_edge_key(line) for line in _edges(lines)})
+    return {key for key, count in counts.items() if count >= max(2, REPEATED_LINE_SHARE * len(pages))}
+
+def clean_lines(page_texts):
+    """
+    The lines of a document as (text, page) pairs, without page headers and
+    footers, page numbers, table of contents entries or blank lines
+    """
+    pages = [[line.strip() for line in reflow(text).split("\n")] for text in page_texts]
+    repeated = repeated_edge_lines(pages)
+
+    lines = []
+    for page, page_lines in enumerate(pages):
+        filled = [line for line in page_lines if line]
+        if filled and sum(1 for line in filled if TOC_LINE.search(line)) >= TOC_PAGE_SHARE * len(filled):
+            continue
+        edges = set(_edges(page_lines))
+        for line in page_lines:
+            if not line or PAGE_NUMBER.match(line) or TOC_LINE.search(line):
+                continue
+            if line in edges and _edge_key(line) in repeated:
+                continue
+            lines.append((line, page))
+    return lines
+
+def heading(line):
+    """
+    Classifies a line that opens a logical unit
+    Returns ("article", "Art. N"), ("section", "§ N.N"), ("group", None) or (None, None)
+    """
+    match = ARTICLE.match(line)
+    if match:
+        return "article", f"Art. {match.group(1)}"
+    if GROUP.match(line):
+        return "group", None
+    match = SECTION.match(line)
+    if match:
+        return "section", "§ " + next(group for group in match.groups() if group)
+    return None, None
+
+def logical_units(lines):
+    """
+    Groups (text, page) lines into articles/sections, each a dict with its
+    label (None for text before the first heading) and lines
+    Short title/chapter headings are folded into the unit that follows them
+    """
+    units = []
+    for line, page in lines:
+        kind, label = heading(line)
+        if kind is None and units:
+            units[-1]["lines"].append((line, page))
+            continue
+
+        unit = {"label": label, "group": kind == "group", "lines": [(line, page)]}
+        previous = units[-1] if units else None
+        if (kind is not None and previous and previous["group"]
+                and sum(len(text) for text, _ in previous["lines"]) <= PREFIX_MAX_CHARS):
+            unit["lines"] = previous["lines"] + unit["lines"]
+            units.pop()
+        units.append(unit)
+    return units
+
+def _split_unit(lines, max_chars):
+    """
+    Splits a unit's lines into pieces of at most max_chars, breaking before
+    numbered controls and list items where possible
+    Returns (text, first page) pairs
+    """
+    blocks = []
+    for line, page in lines:
+        if blocks and not ITEM.match(line):
+            blocks[-1][0].append(line)
+        else:
+            blocks.append(([line], page))
+
+    pieces = []
+    splitter = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+    for block_lines, page in blocks:
+        text = "\n".join(block_lines)
+        parts = [text] if len(text) <= max_chars else splitter.split_text(text)
+        for part in parts:
+            if pieces and len(pieces[-1][0]) + 1 + len(part) <= max_chars:
+                pieces[-1] = (pieces[-1][0] + "\n" + part, pieces[-1][1])
+            else:
+                pieces.append((part, page))
+    return pieces
+
+def structure_chunks(page_texts, max_chars=STRUCTURE_MAX_CHARS):
+    """
+    Chunks one document along its own structure: one chunk per article or
+    numbered section, split at control/item boundaries when longer than
+    max_chars, with headers, footers and the table of contents removed
+    Returns (text, page, article id) triples
+    """
+    chunks = []
+    for unit in logical_units(clean_lines(page_texts)):
+        for text, page in _split_unit(unit["lines"], max_chars):
+            chunks.append((text, page, unit["label"]))
+    return chunks
+
+def structure_split_documents(docs, max_chars=STRUCTURE_MAX_CHARS):
+    """
+    Chunks per-page Documents with structure_chunks, file by file
+    Chunks keep their file's metadata plus the page they start on and their
+    article_id ("Art. 38", "§ 14.5.2", or None outside numbered units)
+    """
+    by_source = {}
+    for doc in docs:
+        by_source.setdefault(doc.metadata.get("source", ""), []).append(doc)
+
+    chunks = []
+    for pages in by_source.values():
+        pages = sorted(pages, key=lambda doc: doc.metadata.get("page", 0))
+        base = {key: value for key, value in pages[0].metadata.items() if key != "page"}
+        for text, page, article_id in structure_chunks([doc.page_content for doc in pages], max_chars):
+            metadata = dict(base, page=pages[page].metadata.get("page", page), article_id=article_id)
+            chunks.append(Document(page_content=text, metadata=metadata))
+    return chunks
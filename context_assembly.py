@@ -0,0 +1,148 @@
+# context_assembly.py
+
+import os
+import numpy as np
+from dotenv import load_dotenv
+from gap_analysis import normalize_rows
+from utils import CHUNK_OVERLAP, count_tokens, truncate_to_tokens
+import metrics
+
+load_dotenv()
+
+# Candidates retrieved per query before diversity selection
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "20"))
+# Most chunks put in one prompt
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "6"))
+# 1.0 ranks by relevance only, lower values favour chunks unlike those already picked
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to a picked chunk are dropped as near-duplicates
+DUPLICATE_SIMILARITY = 0.95
+# Shortest shared text between neighbouring chunks treated as splitter overlap
+MIN_OVERLAP_CHARS = 20
+
+def chunk_position(chunk_id):
+    """Splits a "<file>:<n>" chunk id into (file, n), with n None for other ids"""
+    fname, _, n = str(chunk_id).rpartition(":")
+    return (fname, int(n)) if fname and n.isdigit() else (chunk_id, None)
+
+def strip_overlap(previous, text, max_overlap=CHUNK_OVERLAP * 2):
+    """
+    Removes the start of text that repeats the end of previous, which is how
+    the splitter's chunk overlap shows up between neighbouring chunks
+    """
+    limit = min(len(previous), len(text), max_overlap)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(text[:size]):
+            return text[size:].lstrip()
+    return text
+
+def mmr(query_vector, vectors, max_items, lambda_mult=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """
+    Maximal marginal relevance over normalized vectors: repeatedly picks the
+    candidate maximizing lambda * sim(query) - (1 - lambda) * max sim(picked)
+    Returns the indices of the picked candidates, in pick order
+    """
+    if not len(vectors):
+        return []
+    relevance = vectors @ query_vector
+    pairwise = vectors @ vectors.T
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    picked = []
+
+    while len(picked) < max_items and available.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * np.maximum(redundancy, 0)
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        available &= redundancy < duplicate_similarity
+    return picked
+
+class ContextAssembler:
+    """
+    Builds the retrieved-context part of a prompt from a Retriever:
+    - over-fetches fetch_k candidates per query
+    - drops exact and near-duplicate chunks and picks a diverse subset with
+      MMR on the stored vectors
+    - collapses whitespace and strips the overlap between neighbouring
+      chunks of the same file
+    - packs the chunks, each with a numbered source citation, into a token budget
+    """
+    def __init__(self, retriever, fetch_k=CONTEXT_FETCH_K, max_chunks=CONTEXT_MAX_CHUNKS, mmr_lambda=MMR_LAMBDA):
+        self.retriever = retriever
+        self.fetch_k = fetch_k
+        self.max_chunks = max_chunks
+        self.mmr_lambda = mmr_lambda
+
+    def select(self, queries, filters=None):
+        """
+        Picks the chunks to show for each query, from the files matching filters
+        Returns, per query, a list of (docstore id, Document) in relevance order
+        """
+        if not queries:
+            return []
+        with metrics.timed("context_select"):
+            query_vectors = normalize_rows(self.retriever.embed_queries(queries))
+            candidates = self.retriever.batch_search_ids(queries, k=self.fetch_k, vectors=query_vectors,
+                                                         filters=filters)
+
+            selections = []
+            for query_vector, ids in zip(query_vectors, candidates):
+                docs = self.retriever.documents(ids)
+                # Exact duplicates (e.g. the same text in two files) keep their best-ranked copy
+                seen = set()
+                unique = []
+                for doc_id, doc in zip(ids, docs):
+                    key = " ".join(doc.page_content.split()).lower()
+                    if key not in seen:
+                        seen.add(key)
+                        unique.append((doc_id, doc))
+
+                vectors = normalize_rows(self.retriever.partitions.vectors([doc_id for doc_id, _ in unique]))
+                picked = mmr(query_vector, vectors, self.max_chunks, self.mmr_lambda)
+                selections.append([unique[i] for i in picked])
+        return selections
+
+    def pack(self, chunks, max_tokens):
+        """
+        Formats selected chunks as numbered, cited passages, stopping (and
+        truncating the last passage) once max_tokens is reached
+        """
+        # Extracted PDF text often puts every word on its own line; collapsing
+        # whitespace alone saves a large share of the prompt tokens
+        texts = {doc_id: " ".join(doc.page_content.split()) for doc_id, doc in chunks}
+        parts = []
+        used = 0
+        for number, (doc_id, doc) in enumerate(chunks, start=1):
+            text = texts[doc_id]
+            fname, n = chunk_position(doc_id)
+            previous = texts.get(f"{fname}:{n - 1}") if n is not None else None
+            if previous:
+                text = strip_overlap(previous, text)
+
+            source = os.path.basename(doc.metadata.get("source", "")) or fname
+            article = doc.metadata.get("article_id")
+            page = doc.metadata.get("page")
+            citation = f"[{number}] {source}" + (f", {article}" if article else "")
+            citation += f", p. {page + 1}" if isinstance(page, int) else ""
+            # Chunks merged from near-identical copies name the other files too
+            others = sorted({copy["source"] for copy in doc.metadata.get("sources", [])} - {source})
+            citation += f" (also in {', '.join(others)})" if others else ""
+            part = f"{citation}\n{text}"
+
+            tokens = count_tokens(part)
+            if used + tokens > max_tokens:
+                remaining = max_tokens - used
+                if remaining > 50:
+                    parts.append(truncate_to_tokens(part, remaining))
+                break
+            parts.append(part)
+            # Blank line between passages
+            used += tokens + 1
+        return "\n\n".join(parts)
+
+    def assemble(self, query, max_tokens, filters=None):
+        """Selects and packs the context for a single query"""
+        return self.pack(self.select([query], filters)[0], max_tokens)
@@ -0,0 +1,136 @@
+# dedup.py
+
+import hashlib
+import json
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Estimated Jaccard similarity of word shingles above which two chunks are
+# merged; 0 disables deduplication
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+# LSH bands of NUM_PERMUTATIONS // LSH_BANDS rows; candidates share at least one band
+LSH_BANDS = 16
+DEDUP_REPORT_FILE = "dedup_report.json"
+
+# Multiply-shift hash functions standing in for random permutations
+_rng = np.random.RandomState(1)
+_A = _rng.randint(0, 1 << 62, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64) * 2 + 1
+_B = _rng.randint(0, 1 << 62, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+
+def shingles(text, size=SHINGLE_SIZE):
+    """32-bit hashes of the overlapping size-word windows of a text"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + size]).encode("utf-8"), digest_size=4).digest(), "little")
+        for i in range(len(words) - size + 1)
+    }
+
+def minhash_signatures(texts):
+    """(len(texts), NUM_PERMUTATIONS) MinHash signatures of the texts' shingles"""
+    signatures = np.empty((len(texts), NUM_PERMUTATIONS), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter(shingles(text), dtype=np.uint64)
+        # (a * x + b) mod 2**64, keeping the high 32 bits, one column per permutation
+        signatures[row] = ((np.outer(hashes, _A) + _B) >> np.uint64(32)).min(axis=0)
+    return signatures
+
+def near_duplicate_groups(texts, threshold=DEDUP_THRESHOLD):
+    """
+    Groups texts whose estimated Jaccard similarity is at least threshold,
+    using LSH bands to find candidate pairs
+    Returns (members, similarities) for every group of two or more texts:
+    the indices in ascending order and each member's similarity to the first
+    """
+    if threshold <= 0 or len(texts) < 2:
+        return []
+    signatures = minhash_signatures(texts)
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+
+    parent = list(range(len(texts)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(LSH_BANDS):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band * rows:(band + 1) * rows])):
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                root_i, root_j = find(members[0]), find(j)
+                if root_i != root_j and np.mean(signatures[members[0]] == signatures[j]) >= threshold:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups = {}
+    for i in range(len(texts)):
+        groups.setdefault(find(i), []).append(i)
+    return [
+        (members, [float(np.mean(signatures[members[0]] == signatures[i])) for i in members])
+        for members in groups.values() if len(members) > 1
+    ]
+
+def dedupe_chunks(docs, ids, threshold=DEDUP_THRESHOLD):
+    """
+    Collapses near-duplicate chunks into the first of each group, whose
+    metadata gets a "sources" list of every merged copy (chunk id, source
+    file and page, the kept chunk first)
+    Returns the kept docs and ids, and the merged groups as dicts
+    """
+    groups = near_duplicate_groups([doc.page_content for doc in docs], threshold)
+    dropped = set()
+    merges = []
+    for members, similarities in groups:
+        kept = members[0]
+        sources = [
+            {"chunk_id": ids[i], "source": os.path.basename(docs[i].metadata.get("source", "")),
+             "page": docs[i].metadata.get("page")}
+            for i in members
+        ]
+        docs[kept].metadata["sources"] = sources
+        dropped.update(members[1:])
+        merges.append({"kept": ids[kept], "merged": [ids[i] for i in members[1:]],
+                       "min_similarity": round(min(similarities), 3), "sources": sources})
+
+    kept_docs = [doc for i, doc in enumerate(docs) if i not in dropped]
+    kept_ids = [chunk_id for i, chunk_id in enumerate(ids) if i not in dropped]
+    return kept_docs, kept_ids, merges
+
+def chunk_files(chunk_id, metadata):
+    """Files a stored chunk stands for: its own plus those of merged copies"""
+    files = [chunk_id.rsplit(":", 1)[0]]
+    for source in metadata.get("sources", []):
+        if source["source"] not in files:
+            files.append(source["source"])
+    return files
+
+def save_dedup_report(vectordb, path):
+    """
+    Writes the merges recorded in a vector store's metadata, so the report
+    always matches what is stored
+    """
+    merges = []
+    merged_chunks = 0
+    for chunk_id in vectordb.index_to_docstore_id.values():
+        sources = vectordb.docstore.search(chunk_id).metadata.get("sources")
+        if sources:
+            merges.append({"kept": chunk_id, "sources": sources})
+            merged_chunks += len(sources) - 1
+    report = {
+        "threshold": DEDUP_THRESHOLD,
+        "stored_chunks": vectordb.index.ntotal,
+        "merged_chunks": merged_chunks,
+        "groups": merges,
+    }
+    with open(os.path.join(path, DEDUP_REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
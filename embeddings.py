@@ -0,0 +1,98 @@
+# embeddings.py
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import os
+import threading
+from dotenv import load_dotenv
+from cache import LRUCache, normalize_query
+import metrics
+
+load_dotenv()
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# "torch" runs the sentence-transformers model, "onnx" an exported (by default
+# int8-quantized) copy of it through onnxruntime, without loading PyTorch
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_BACKENDS = ("torch", "onnx")
+# CPU threads used per embedding call, 0 for the library default
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+# Query embeddings keyed by normalized query text (the model is uncased)
+query_embedding_cache = LRUCache(
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", "4096")),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_MB", "32")) * 1024 * 1024
+)
+metrics.register_cache("query_embedding", query_embedding_cache)
+
+class EmbeddingService(Embeddings):
+    """
+    Sentence-transformers model wrapper producing L2-normalized float32 vectors
+    Implements the langchain Embeddings interface so it can back FAISS stores
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE):
+        from sentence_transformers import SentenceTransformer
+        
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
+        
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def _encode(self, texts, batch_size):
+        """Normalized embeddings of a non-empty list of texts"""
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    def embed(self, texts, batch_size=None):
+        """
+        Embeds a list of texts in batches
+        Returns a (len(texts), dimension) float32 NumPy array
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        
+        vectors = self._encode(texts, batch_size or self.batch_size)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def embed_documents(self, texts):
+        return self.embed(texts).tolist()
+
+    def embed_query(self, text):
+        key = (self.model_name, normalize_query(text))
+        vector = query_embedding_cache.get(key)
+        if vector is None:
+            with metrics.timed("embed_query"):
+                vector = self.embed([text])[0]
+            query_embedding_cache.set(key, vector)
+        return vector.tolist()
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_embedding_service():
+    """
+    Returns the process-wide embedding service, loading the model of the
+    configured EMBEDDING_BACKEND on first use
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+                raise ValueError(f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND}, expected one of {EMBEDDING_BACKENDS}")
+            if EMBEDDING_BACKEND == "onnx":
+                from onnx_embeddings import OnnxEmbeddingService
+                _service = OnnxEmbeddingService()
+            else:
+                _service = EmbeddingService()
+        return _service
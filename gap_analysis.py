@@ -0,0 +1,164 @@
+# gap_analysis.py
+
+import json
+import os
+import numpy as np
+
+# Cosine similarity above which a global chunk counts as covered internally
+DEFAULT_THRESHOLD = 0.6
+
+def extract_vectors(vectordb):
+    """
+    Returns every vector of a FAISS store with its docstore id, in index order
+    Compact stores give their exact vectors, memory-mapped from the file
+    save_compact wrote, rather than ones decoded from the quantized index
+    """
+    index = vectordb.index
+    if not index.ntotal:
+        return np.zeros((0, index.d), dtype=np.float32), []
+    vectors_path = getattr(vectordb, "vectors_path", None)
+    if vectors_path:
+        vectors = np.load(vectors_path, mmap_mode="r")
+        ids = [vectordb.index_to_docstore_id[i] for i in range(index.ntotal)]
+        return vectors, ids
+    try:
+        vectors = index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        # IVF indexes need a direct map to reconstruct vectors by position
+        import faiss
+        faiss.extract_index_ivf(index).make_direct_map()
+        vectors = index.reconstruct_n(0, index.ntotal)
+    ids = [vectordb.index_to_docstore_id[i] for i in range(index.ntotal)]
+    return np.ascontiguousarray(vectors, dtype=np.float32), ids
+
+def normalize_rows(vectors):
+    """L2-normalizes rows so dot products are cosine similarities"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k_similar(queries, targets, k=1, block_size=1024):
+    """
+    For each query row, the indices and cosine scores of its k most similar target rows
+    The similarity matrix is computed block by block, so memory stays at
+    block_size x block_size floats however large both sets are
+    """
+    queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+    targets = normalize_rows(np.asarray(targets, dtype=np.float32))
+    k = min(k, len(targets))
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_indices = np.full((len(queries), k), -1, dtype=np.int64)
+    if k == 0:
+        return best_indices, best_scores
+    
+    for q_start in range(0, len(queries), block_size):
+        q_block = queries[q_start:q_start + block_size]
+        scores = best_scores[q_start:q_start + block_size]
+        indices = best_indices[q_start:q_start + block_size]
+        
+        for t_start in range(0, len(targets), block_size):
+            sims = q_block @ targets[t_start:t_start + block_size].T
+            block_indices = np.broadcast_to(
+                np.arange(t_start, t_start + sims.shape[1], dtype=np.int64), sims.shape
+            )
+            
+            # Merge this block's candidates with the running top-k
+            all_scores = np.concatenate([scores, sims], axis=1)
+            all_indices = np.concatenate([indices, block_indices], axis=1)
+            keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+            scores[:] = np.take_along_axis(all_scores, keep, axis=1)
+            indices[:] = np.take_along_axis(all_indices, keep, axis=1)
+    
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_indices, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+def compute_coverage(global_db, internal_db, threshold=DEFAULT_THRESHOLD, block_size=1024):
+    """
+    Matches every chunk of the global store to its most similar internal chunk
+    Returns one dict per global chunk with the best match, its score and
+    whether it clears the threshold
+    """
+    global_vectors, global_ids = extract_vectors(global_db)
+    internal_vectors, internal_ids = extract_vectors(internal_db)
+    indices, scores = top_k_similar(global_vectors, internal_vectors, k=1, block_size=block_size)
+    
+    matches = []
+    for i, global_id in enumerate(global_ids):
+        best = int(indices[i, 0]) if indices.shape[1] else -1
+        score = float(scores[i, 0]) if best >= 0 else 0.0
+        matches.append({
+            "global_id": global_id,
+            "internal_id": internal_ids[best] if best >= 0 else None,
+            "score": score,
+            "covered": score >= threshold
+        })
+    return matches
+
+COVERAGE_FILE = "coverage.json"
+COVERAGE_TOP_K = 3
+
+def build_coverage_index(global_db, internal_db, k=COVERAGE_TOP_K, block_size=1024):
+    """
+    Maps every global chunk to its k most similar internal chunks, with the
+    source PDF and page of both sides
+    """
+    global_vectors, global_ids = extract_vectors(global_db)
+    internal_vectors, internal_ids = extract_vectors(internal_db)
+    indices, scores = top_k_similar(global_vectors, internal_vectors, k=k, block_size=block_size)
+    
+    internal_meta = {}
+    for internal_id in internal_ids:
+        metadata = internal_db.docstore.search(internal_id).metadata
+        internal_meta[internal_id] = (os.path.basename(metadata.get("source", "")), metadata.get("page"))
+    
+    entries = []
+    for i, global_id in enumerate(global_ids):
+        metadata = global_db.docstore.search(global_id).metadata
+        matches = []
+        for idx, score in zip(indices[i], scores[i]):
+            if idx < 0:
+                continue
+            internal_id = internal_ids[int(idx)]
+            source, page = internal_meta[internal_id]
+            matches.append({"internal_id": internal_id, "source": source, "page": page, "score": round(float(score), 4)})
+        entries.append({
+            "global_id": global_id,
+            "source": os.path.basename(metadata.get("source", "")),
+            "page": metadata.get("page"),
+            "matches": matches
+        })
+    return entries
+
+def save_coverage_index(path, entries, version):
+    """Writes the coverage index with the fingerprint of the stores it was built from"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "entries": entries}, f)
+    os.replace(tmp_path, path)
+
+def load_coverage_index(path, version):
+    """Loads the coverage index if it was built from the given store versions, else None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stored.get("version") != version:
+        return None
+    return stored["entries"]
+
+def query_coverage(entries, source=None, threshold=DEFAULT_THRESHOLD, uncovered_only=False):
+    """
+    Filters a coverage index by global source file (case-insensitive substring)
+    Each returned entry gets its best score and a covered flag for the threshold
+    """
+    results = []
+    for entry in entries:
+        if source and source.lower() not in entry["source"].lower():
+            continue
+        best_score = entry["matches"][0]["score"] if entry["matches"] else 0.0
+        covered = best_score >= threshold
+        if uncovered_only and covered:
+            continue
+        results.append(dict(entry, best_score=best_score, covered=covered))
+    return results
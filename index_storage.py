@@ -0,0 +1,178 @@
+# index_storage.py
+
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+import faiss
+import json
+import math
+import os
+import sqlite3
+import threading
+import numpy as np
+from dotenv import load_dotenv
+from gap_analysis import extract_vectors
+
+load_dotenv()
+
+# "flat" keeps langchain's save_local format (flat index + pickled docstore);
+# "sq8", "ivf" and "ivfpq" use the compact format below
+INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat").lower()
+INDEX_TYPES = ("flat", "sq8", "ivf", "ivfpq")
+NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_FILE = "docstore.sqlite3"
+
+class ReadOnlyStoreError(Exception):
+    """Raised when a compact store opened for serving is asked to change"""
+    pass
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only docstore kept in SQLite instead of a pickled dict, so worker
+    processes share its pages through the OS cache
+    Documents are only written by save_compact
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata FROM docs WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+class CompactFAISS(FAISS):
+    """
+    A compact store opened read-only: its index is memory-mapped and its
+    documents live in SQLite, so it refuses updates before touching either
+    Load it with writable=True to add or delete chunks, then save_compact it
+    vectors_path is the file of its exact vectors, which similarity
+    computations use instead of vectors decoded from the quantized index
+    """
+    vectors_path = None
+
+    def _read_only(self, *args, **kwargs):
+        raise ReadOnlyStoreError(
+            "Compact stores are opened read-only; update them with "
+            "load_compact(..., writable=True) and save_compact"
+        )
+
+    add_texts = add_embeddings = add_documents = delete = merge_from = _read_only
+
+def _factory_string(index_type, n, d):
+    """FAISS index_factory description for an index type and corpus size"""
+    if index_type == "sq8":
+        return "SQ8"
+    
+    # Roughly 4 * sqrt(n) lists, with at least 39 training points per list
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    
+    # PQ codebooks need a few hundred training points per sub-quantizer
+    if n < 1024:
+        return f"IVF{nlist},SQ8"
+    m = max(x for x in range(1, 49) if d % x == 0)
+    return f"IVF{nlist},PQ{m}x8"
+
+def save_compact(vectordb, path, index_type):
+    """
+    Writes a vector store in the compact format:
+    - index.faiss: quantized FAISS index, memory-mapped when loaded
+    - vectors.npy: the full-precision vectors, used to rebuild the index on updates
+    - docstore.sqlite3: chunk texts and metadata by id, in index order
+    """
+    os.makedirs(path, exist_ok=True)
+    vectors, ids = extract_vectors(vectordb)
+    n, d = vectors.shape
+    
+    index = faiss.index_factory(d, _factory_string(index_type, n, d))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    faiss.write_index(index, os.path.join(path, INDEX_FILE + ".tmp"))
+    
+    with open(os.path.join(path, VECTORS_FILE + ".tmp"), "wb") as f:
+        np.save(f, vectors)
+    
+    docstore_tmp = os.path.join(path, DOCSTORE_FILE + ".tmp")
+    if os.path.exists(docstore_tmp):
+        os.remove(docstore_tmp)
+    conn = sqlite3.connect(docstore_tmp)
+    try:
+        conn.execute(
+            "CREATE TABLE docs (pos INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO docs (pos, id, content, metadata) VALUES (?, ?, ?, ?)",
+            (
+                (pos, doc_id, doc.page_content, json.dumps(doc.metadata))
+                for pos, doc_id in enumerate(ids)
+                for doc in [vectordb.docstore.search(doc_id)]
+            )
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    
+    for name in (INDEX_FILE, VECTORS_FILE, DOCSTORE_FILE):
+        os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+
+def _read_ids(path):
+    conn = sqlite3.connect(os.path.join(path, DOCSTORE_FILE))
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM docs ORDER BY pos")]
+    finally:
+        conn.close()
+
+def load_compact(path, embeddings, index_type, writable=False):
+    """
+    Opens a compact vector store
+    By default the quantized index is memory-mapped read-only and documents
+    are read from SQLite on demand; adding or deleting chunks then raises
+    ReadOnlyStoreError. With writable=True the full-precision
+    vectors and all documents are loaded into a regular flat store that can
+    be updated and written back with save_compact.
+    """
+    ids = _read_ids(path)
+    index_to_docstore_id = dict(enumerate(ids))
+    
+    if writable:
+        vectors = np.load(os.path.join(path, VECTORS_FILE))
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        conn = sqlite3.connect(os.path.join(path, DOCSTORE_FILE))
+        try:
+            docstore = InMemoryDocstore({
+                doc_id: Document(page_content=content, metadata=json.loads(metadata))
+                for doc_id, content, metadata in conn.execute("SELECT id, content, metadata FROM docs")
+            })
+        finally:
+            conn.close()
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+    
+    # IVF inverted lists are mmapped with IO_FLAG_MMAP; the codes of flat and
+    # scalar-quantized indexes need IO_FLAG_MMAP_IFC (FAISS >= 1.8, else read into RAM)
+    if index_type.startswith("ivf"):
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    else:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), flags)
+    try:
+        faiss.extract_index_ivf(index).nprobe = NPROBE
+    except RuntimeError:
+        pass
+    docstore = SQLiteDocstore(os.path.join(path, DOCSTORE_FILE))
+    vectordb = CompactFAISS(embeddings, index, docstore, index_to_docstore_id)
+    vectordb.vectors_path = os.path.join(path, VECTORS_FILE)
+    return vectordb
@@ -0,0 +1,147 @@
+# jobs.py
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "64"))
+JOB_TTL = float(os.getenv("JOB_TTL", str(24 * 3600)))
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are waiting to run"""
+    pass
+
+class JobStore:
+    """
+    SQLite-backed job records, so any worker process on the host can report
+    the status and result of a job started by another one
+    """
+    def __init__(self, path, ttl=JOB_TTL):
+        self.path = path
+        self.ttl = ttl
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "result TEXT, error TEXT, worker INTEGER, "
+                "created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Connection committed when the block succeeds and closed in any case"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, job_id, kind):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, worker, created, updated) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, os.getpid(), now, now)
+            )
+            conn.execute("DELETE FROM jobs WHERE updated < ?", (now - self.ttl,))
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if unknown or expired"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, result, error, created, updated FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        
+        job = {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "created": row[5],
+            "updated": row[6]
+        }
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+class JobManager:
+    """
+    Runs analysis jobs on a bounded thread pool and records them in a JobStore
+    Jobs go through queued -> running -> completed | failed
+    """
+    def __init__(self, store, max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.store = store
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, cleanup=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs); a falsy return value marks the job failed
+        cleanup, if given, runs after the job whatever its outcome
+        Returns the job id; raises JobQueueFull when the backlog is full
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+        
+        job_id = uuid.uuid4().hex
+        try:
+            self.store.create(job_id, kind)
+            self._executor.submit(self._run, job_id, fn, args, kwargs, cleanup)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs, cleanup):
+        try:
+            self.store.update(job_id, "running")
+            result = fn(*args, **kwargs)
+            if result:
+                self.store.update(job_id, "completed", result=result)
+            else:
+                self.store.update(job_id, "failed", error="Analysis failed")
+        except Exception as e:
+            print(f"Error in job {job_id}: {str(e)}")
+            self.store.update(job_id, "failed", error=str(e))
+        finally:
+            with self._lock:
+                self._pending -= 1
+            if cleanup:
+                cleanup()
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
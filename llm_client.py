@@ -0,0 +1,179 @@
+# llm_client.py
+
+import json
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+# Any OpenAI-compatible chat-completions endpoint works, e.g. llm_stub_server.py
+API_URL = os.getenv("LLM_API_URL", 'https://openrouter.ai/api/v1/chat/completions')
+LLM_MODEL = os.getenv("LLM_MODEL", "mistralai/mistral-7b-instruct")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+class LLMError(Exception):
+    """Raised when the chat-completions API cannot produce a response"""
+    pass
+
+class LLMClient:
+    """
+    Chat-completions client shared by the analyzers
+    - one pooled HTTP session (keep-alive, no TLS handshake per request)
+    - connect/read timeouts so a stalled upstream cannot pin a worker
+    - bounded retries with jittered exponential backoff on 429/5xx and
+      connection errors, honouring Retry-After
+    - a semaphore limiting concurrent upstream requests
+    """
+    def __init__(self, api_key, api_url=API_URL, model=LLM_MODEL,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, max_concurrency=MAX_CONCURRENCY,
+                 backoff_base=1.0, backoff_max=30.0):
+        self.api_url = api_url
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "HTTP-Referer": "https://localhost:5000",
+            "Content-Type": "application/json"
+        })
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """Delay before the next attempt: Retry-After if given, else full jitter"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, payload, stream=False, hold=False):
+        """
+        POST a payload to the API with retries
+        Each attempt takes a concurrency slot, released before any backoff
+        sleep. With hold=True the successful attempt keeps its slot and the
+        caller must release it once done with the response
+        Returns the successful response; raises LLMError once retries are exhausted
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            held = False
+            self._semaphore.acquire()
+            try:
+                response = self.session.post(
+                    self.api_url, json=payload, timeout=self.timeout, stream=stream
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    held = hold
+                    return response
+                
+                retry_after = response.headers.get("Retry-After")
+                last_error = LLMError(f"Upstream returned HTTP {response.status_code}")
+                reason = str(response.status_code)
+                response.close()
+            except requests.Timeout as e:
+                last_error = e
+                reason = "timeout"
+            except requests.ConnectionError as e:
+                last_error = e
+                reason = "connection"
+            except requests.HTTPError as e:
+                raise LLMError(str(e)) from e
+            finally:
+                if not held:
+                    self._semaphore.release()
+            
+            if attempt < self.max_retries:
+                metrics.llm_retries_total.inc(reason=reason)
+                time.sleep(self._backoff_delay(attempt, retry_after))
+        
+        raise LLMError(f"Request failed after {self.max_retries + 1} attempts: {last_error}")
+
+    def complete(self, prompt):
+        """Returns the completion text for a single user prompt"""
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        with metrics.timed("llm_call"):
+            try:
+                response = self.post(payload)
+                body = response.json()
+                content = body['choices'][0]['message']['content']
+            except (ValueError, KeyError, IndexError) as e:
+                metrics.llm_requests_total.inc(outcome="error")
+                raise LLMError(f"Unexpected response format: {str(e)}") from e
+            except LLMError:
+                metrics.llm_requests_total.inc(outcome="error")
+                raise
+        metrics.llm_requests_total.inc(outcome="success")
+        metrics.record_usage(body.get("usage"))
+        return content
+
+
+    def stream(self, prompt):
+        """
+        Streams the completion for a single user prompt
+        Yields text deltas as they arrive; the concurrency slot of the
+        successful attempt is held until the stream is exhausted or closed
+        """
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+        with metrics.timed("llm_stream"):
+            try:
+                response = self.post(payload, stream=True, hold=True)
+            except LLMError:
+                metrics.llm_requests_total.inc(outcome="error")
+                raise
+            outcome = "error"
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    # Blank lines separate events; ":" lines are keep-alive comments
+                    if not line or line.startswith(":") or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data)
+                    except ValueError:
+                        continue
+                    if "error" in chunk:
+                        raise LLMError(f"Upstream error: {chunk['error']}")
+                    # Usage, when the provider sends it, comes with the last chunk
+                    metrics.record_usage(chunk.get("usage"))
+                    choices = chunk.get("choices") or [{}]
+                    text = (choices[0].get("delta") or {}).get("content")
+                    if text:
+                        yield text
+                outcome = "success"
+            except requests.RequestException as e:
+                raise LLMError(f"Stream interrupted: {str(e)}") from e
+            finally:
+                metrics.llm_requests_total.inc(outcome=outcome)
+                response.close()
+                self._semaphore.release()
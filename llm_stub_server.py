@@ -0,0 +1,193 @@
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import uuid
+
+# Canned answer, shaped like a real analysis so score parsing and the UI work
+STUB_ANALYSIS = (
+    "Compliance Score: 72%\n"
+    "The policy covers most of the relevant requirements.\n\n"
+    "Risk Assessment\n"
+    "- Incomplete access reviews (Medium)\n"
+    "- Missing incident escalation contacts (High)\n\n"
+    "Implementation Status\n"
+    "- Define a quarterly access review procedure\n"
+    "- Document the incident escalation chain\n\n"
+    "Policy Coverage\n"
+    "- Access control and encryption are covered; logging retention is not."
+)
+
+def stub_tokens(count):
+    """The canned analysis cut or repeated to count whitespace-separated tokens"""
+    words = STUB_ANALYSIS.replace("\n", " \n ").split(" ")
+    words = [w for w in words if w]
+    tokens = [words[i % len(words)] for i in range(max(count, 1))]
+    return [token if token == "\n" else token + " " for token in tokens]
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers POST .../chat/completions like an OpenAI-compatible API"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        config = self.server.config
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.rng.random() < config["error_rate"]
+            delay = config["latency"] + self.server.rng.uniform(0, config["jitter"])
+        time.sleep(delay)
+
+        if fail:
+            with self.server.lock:
+                self.server.errors += 1
+            return self._send_json(config["error_status"], {
+                "error": {"message": "Injected upstream error", "code": config["error_status"]}
+            })
+
+        prompt = " ".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        tokens = stub_tokens(config["completion_tokens"])
+        usage = {
+            "prompt_tokens": len(prompt.split()),
+            "completion_tokens": len(tokens),
+            "total_tokens": len(prompt.split()) + len(tokens),
+        }
+        model = payload.get("model", "stub")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if payload.get("stream"):
+            return self._stream(completion_id, model, tokens, usage)
+
+        if config["tokens_per_second"]:
+            time.sleep(len(tokens) / config["tokens_per_second"])
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, completion_id, model, tokens, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        interval = 1.0 / self.server.config["tokens_per_second"] if self.server.config["tokens_per_second"] else 0
+        try:
+            self.wfile.write(b": stub keep-alive\n\n")
+            for i, token in enumerate(tokens):
+                if interval:
+                    time.sleep(interval)
+                self._send_event({
+                    "id": completion_id, "object": "chat.completion.chunk", "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                })
+            self._send_event({
+                "id": completion_id, "object": "chat.completion.chunk", "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.config["verbose"]:
+            super().log_message(format, *args)
+
+def create_server(host="127.0.0.1", port=0, latency=0.0, jitter=0.0, tokens_per_second=0.0,
+                  completion_tokens=120, error_rate=0.0, error_status=503, seed=None, verbose=False):
+    """
+    Creates a stub chat-completions server (call serve_forever to run it)
+    - latency/jitter: seconds before the response starts
+    - tokens_per_second: generation speed, 0 for instant
+    - error_rate/error_status: share of requests answered with that HTTP error
+    Port 0 picks a free port; see server.url for the endpoint
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency": latency,
+        "jitter": jitter,
+        "tokens_per_second": tokens_per_second,
+        "completion_tokens": completion_tokens,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "verbose": verbose,
+    }
+    server.lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.requests = 0
+    server.errors = 0
+    server.url = f"http://{host}:{server.server_address[1]}/v1/chat/completions"
+    return server
+
+def start_server(**kwargs):
+    """Starts a stub server in a daemon thread and returns it"""
+    server = create_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the response starts")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Generation speed, 0 for instant")
+    parser.add_argument("--completion-tokens", type=int, default=120, help="Tokens per completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--seed", type=int, help="Seed for jitter and error injection")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = create_server(
+        host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed, verbose=args.verbose
+    )
+    print(f"Stub LLM listening on {server.url}")
+    print(f"Point the app at it with LLM_API_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
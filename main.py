@@ -1,4 +1,5 @@
-from utils import load_documents, create_vector_store
+from utils import load_documents, create_vector_store, update_vector_store
+from gap_analysis import compute_coverage, DEFAULT_THRESHOLD
 
 
 def retrieve_similar_chunks(query, vectordb, k=3):
@@ -28,37 +29,38 @@ def initialize_system(docs_directory):
         print(f"Error initializing system: {str(e)}")
         return None, None
 
-def compare_policies(internal_db, global_db):
+def compare_policies(internal_db, global_db, threshold=DEFAULT_THRESHOLD):
     """
     Compares internal policies with global regulations and identifies mismatches
+    Every global chunk is matched to its most similar internal chunk by cosine
+    similarity; chunks scoring below the threshold are reported as missing
     Returns a list of discrepancies and missing regulations
     """
     try:
-        # Get all chunks from both databases
-        internal_docs = internal_db.similarity_search("policy regulation requirement", k=100)
-        global_docs = global_db.similarity_search("policy regulation requirement", k=100)
+        matches = compute_coverage(global_db, internal_db, threshold=threshold)
         
-        # Extract policy content
-        internal_policies = [doc.page_content.lower() for doc in internal_docs]
-        global_policies = [doc.page_content.lower() for doc in global_docs]
-        
-        # Find missing regulations
+        # Attach the chunk texts and sources to each match
         missing_regulations = []
-        for global_policy in global_policies:
-            found = False
-            for internal_policy in internal_policies:
-                if any(phrase in internal_policy for phrase in global_policy.split('.')):
-                    found = True
-                    break
-            if not found:
-                missing_regulations.append(global_policy)
+        for match in matches:
+            global_doc = global_db.docstore.search(match["global_id"])
+            match["source"] = global_doc.metadata.get("source")
+            match["page"] = global_doc.metadata.get("page")
+            if match["internal_id"] is not None:
+                internal_doc = internal_db.docstore.search(match["internal_id"])
+                match["internal_source"] = internal_doc.metadata.get("source")
+            if not match["covered"]:
+                missing_regulations.append(global_doc.page_content)
+        
+        total_global = len(matches)
         
         # Generate report
         report = {
             "missing_regulations": missing_regulations,
-            "total_internal_policies": len(internal_policies),
-            "total_global_regulations": len(global_policies),
-            "compliance_rate": (len(global_policies) - len(missing_regulations)) / len(global_policies)
+            "matches": matches,
+            "threshold": threshold,
+            "total_internal_policies": internal_db.index.ntotal,
+            "total_global_regulations": total_global,
+            "compliance_rate": (total_global - len(missing_regulations)) / total_global if total_global else 0.0
         }
         
         return report
@@ -72,16 +74,9 @@ def analyze_policy_gaps():
     Analyzes gaps between internal and global policies
     """
     try:
-        # Initialize system with separate directories for internal and global policies
-        internal_docs = load_documents("data/internal")
-        global_docs = load_documents("data/global")
-        
-        if not internal_docs or not global_docs:
-            raise ValueError("Both internal and global documents are required")
-        
-        # Create vector stores
-        internal_db = create_vector_store(internal_docs, is_public=False)
-        global_db = create_vector_store(global_docs, is_public=True)
+        # Load (or build) vector stores for internal and global policies
+        internal_db = update_vector_store("data/internal", is_public=False)
+        global_db = update_vector_store("data/global", is_public=True)
         
         # Compare policies
         comparison_report = compare_policies(internal_db, global_db)
@@ -0,0 +1,239 @@
+# metrics.py
+
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Log one JSON line per request with its status, duration and stage timings
+METRICS_LOG = os.getenv("METRICS_LOG", "false").lower() == "true"
+
+# Latency buckets in seconds, from a cached lookup up to a slow LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = "counter"
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in items]
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def count(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, ([], 0.0, 0))[2]
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, n) for key, (counts, total, n) in self._values.items()]
+        samples = []
+        for key, counts, total, n in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", labels + [("le", _format_value(float(bound)))], count))
+            samples.append((f"{self.name}_bucket", labels + [("le", "+Inf")], n))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, n))
+        return samples
+
+class Registry:
+    """
+    Holds the process metrics and renders them in the Prometheus text format
+    Collectors are callables returning (name, kind, description, samples) for
+    values read at scrape time, such as cache statistics
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, description, labelnames=()):
+        return self._add(Counter(name, description, labelnames))
+
+    def histogram(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, description, labelnames, buckets))
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        families = [(m.name, m.kind, m.description, m.samples()) for m in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {str(e)}")
+
+        lines = []
+        for name, kind, description, samples in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+requests_total = registry.counter(
+    "satim_http_requests_total", "HTTP requests by endpoint and status code", ("endpoint", "status"))
+request_seconds = registry.histogram(
+    "satim_http_request_duration_seconds", "HTTP request latency by endpoint", ("endpoint",))
+stage_seconds = registry.histogram(
+    "satim_stage_duration_seconds", "Time spent in each analysis stage", ("stage",))
+llm_requests_total = registry.counter(
+    "satim_llm_requests_total", "Chat-completions calls by outcome", ("outcome",))
+llm_retries_total = registry.counter(
+    "satim_llm_retries_total", "Retried chat-completions attempts by reason", ("reason",))
+llm_tokens_total = registry.counter(
+    "satim_llm_tokens_total", "Tokens reported in the API usage field", ("type",))
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def register_cache(name, cache):
+    """Expose a cache's stats() (hits, misses, evictions) at scrape time"""
+    with _caches_lock:
+        _caches[name] = cache
+
+def _collect_caches():
+    with _caches_lock:
+        caches = list(_caches.items())
+    stats = [(name, cache.stats()) for name, cache in caches if hasattr(cache, "stats")]
+    families = []
+    for field, kind, description in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses"),
+        ("evictions", "counter", "Cache evictions"),
+        ("entries", "gauge", "Entries currently cached"),
+        ("hit_rate", "gauge", "Hits over lookups since start"),
+    ):
+        samples = [("satim_cache_" + field + ("_total" if kind == "counter" else ""),
+                    [("cache", name)], values[field])
+                   for name, values in stats if field in values]
+        if samples:
+            families.append((samples[0][0], kind, description, samples))
+    return families
+
+registry.register_collector(_collect_caches)
+
+# Stage timings of the request being handled; worker threads see them through bind()
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+_stages_lock = threading.Lock()
+
+def start_request():
+    """Start collecting stage timings for the request handled by this thread"""
+    _request_stages.set({})
+
+def request_stages():
+    """Stage timings collected since start_request, in seconds"""
+    return dict(_request_stages.get() or {})
+
+def bind(fn):
+    """
+    Wraps fn so the stages it times count towards the current request when
+    it runs in another thread (a ThreadPoolExecutor worker)
+    """
+    stages = _request_stages.get()
+    def run(*args, **kwargs):
+        token = _request_stages.set(stages)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request_stages.reset(token)
+    return run
+
+@contextmanager
+def timed(stage):
+    """Record the duration of a block under the given stage name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            with _stages_lock:
+                stages[stage] = stages.get(stage, 0.0) + elapsed
+
+def record_usage(usage):
+    """Count the tokens from a chat-completions usage object"""
+    if not isinstance(usage, dict):
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if isinstance(tokens, int):
+            llm_tokens_total.inc(tokens, type=kind)
+
+def log_line(**fields):
+    """Format a structured log record"""
+    return json.dumps(fields, sort_keys=True, default=str)
@@ -0,0 +1,198 @@
+# onnx_embeddings.py
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from dotenv import load_dotenv
+from embeddings import EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL, EMBEDDING_THREADS, EmbeddingService
+
+load_dotenv()
+
+# Exported models, one directory per model name
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(".cache", "onnx"))
+# Dynamic int8 quantization of the weights; set to false to run the fp32 export
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "true").lower() == "true"
+# Token limit sentence-transformers applies to all-MiniLM-L6-v2
+MAX_SEQUENCE_LENGTH = 256
+# Lowest cosine similarity to the PyTorch embedding accepted by the parity check
+PARITY_THRESHOLD = 0.98
+
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+
+# Texts the parity check embeds when none are given, in both corpus languages
+PARITY_TEXTS = [
+    "Access to information systems is granted on a least-privilege basis.",
+    "Passwords must be at least twelve characters long and rotated every 90 days.",
+    "All laptops and removable media must be encrypted with AES-256.",
+    "Security incidents are reported to the CISO within 24 hours.",
+    "Backups are tested quarterly and stored off-site.",
+    "Le traitement des données à caractère personnel est soumis à une déclaration préalable.",
+    "Article 38 : le responsable du traitement met en œuvre les mesures techniques appropriées.",
+    "CIS Control 5.3: Disable dormant accounts after a period of 45 days of inactivity.",
+]
+
+def model_dir(model_name=EMBEDDING_MODEL):
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+def model_path(model_name=EMBEDDING_MODEL, quantize=ONNX_QUANTIZE):
+    return os.path.join(model_dir(model_name), "model.int8.onnx" if quantize else "model.onnx")
+
+def export_model(model_name=EMBEDDING_MODEL, quantize=ONNX_QUANTIZE):
+    """
+    Exports the transformer of a sentence-transformers model to ONNX, with its
+    tokenizer, and writes a dynamically int8-quantized copy if quantize is True
+    Needs torch, transformers and onnxruntime (plus onnx for quantization)
+    Returns the path of the model to run
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    output_dir = model_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    tokenizer.save_pretrained(output_dir)
+    model = AutoModel.from_pretrained(repo).eval()
+
+    class TokenEmbeddings(torch.nn.Module):
+        """The transformer's last hidden state; pooling happens at inference"""
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids)[0]
+
+    sample = tokenizer(PARITY_TEXTS[:2], padding=True, return_tensors="pt")
+    fp32_path = model_path(model_name, quantize=False)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(model),
+            tuple(sample[name] for name in INPUT_NAMES),
+            fp32_path,
+            input_names=INPUT_NAMES,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    int8_path = model_path(model_name, quantize=True)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+class OnnxEmbeddingService(EmbeddingService):
+    """
+    Same vectors as EmbeddingService (mean-pooled, L2-normalized MiniLM
+    token embeddings), computed by onnxruntime from an exported model
+    The model is exported on first use if it isn't found in ONNX_MODEL_DIR
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                 quantize=ONNX_QUANTIZE, threads=EMBEDDING_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = model_path(model_name, quantize)
+        if not os.path.exists(path):
+            print(f"Exporting {model_name} to ONNX")
+            path = export_model(model_name, quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir(model_name), "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0, pad_token="[PAD]")
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def _encode(self, texts, batch_size):
+        """Normalized embeddings of a non-empty list of texts"""
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            tokens = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+
+            # Mean pooling over the real (unpadded) tokens
+            mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+            pooled = (tokens * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            batches.append(pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12))
+        return np.concatenate(batches)
+
+def parity_check(texts=None, model_name=EMBEDDING_MODEL, quantize=ONNX_QUANTIZE, repeats=5):
+    """
+    Embeds texts with both backends and compares them
+    Returns the min and mean cosine similarity between the two embeddings of
+    each text and the time each backend takes to embed them all
+    """
+    texts = list(texts or PARITY_TEXTS)
+    backends = {"torch": EmbeddingService(model_name), "onnx": OnnxEmbeddingService(model_name, quantize=quantize)}
+
+    vectors = {}
+    seconds = {}
+    for name, service in backends.items():
+        service.embed(texts)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            vectors[name] = service.embed(texts)
+        seconds[name] = (time.perf_counter() - start) / repeats
+
+    cosines = np.sum(vectors["torch"] * vectors["onnx"], axis=1)
+    return {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "torch_seconds": seconds["torch"],
+        "onnx_seconds": seconds["onnx"],
+        "speedup": seconds["torch"] / seconds["onnx"] if seconds["onnx"] else None,
+        "passed": bool(cosines.min() >= PARITY_THRESHOLD),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and check it against PyTorch")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--no-quantize", action="store_true", help="Use the fp32 export instead of int8")
+    parser.add_argument("--texts", help="File with one text per line for the parity check")
+    args = parser.parse_args()
+    quantize = ONNX_QUANTIZE and not args.no_quantize
+
+    if args.command == "export":
+        print(f"Wrote {export_model(args.model, quantize)}")
+        return
+
+    texts = None
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    report = parity_check(texts, args.model, quantize)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if not report["passed"]:
+        print(f"Parity check failed: cosine similarity below {PARITY_THRESHOLD}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# partitions.py
+
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+
+# Metadata every chunk carries besides its page, and the keys search filters accept
+FILTER_KEYS = ("source", "language", "family")
+
+# Frequent function words used to tell French documents from English ones
+FRENCH_WORDS = {"le", "la", "les", "des", "du", "et", "est", "une", "pour", "dans",
+                "par", "sur", "que", "qui", "aux", "au", "ces", "sont", "ou", "être"}
+ENGLISH_WORDS = {"the", "and", "of", "to", "is", "for", "in", "on", "that", "with",
+                 "be", "are", "by", "this", "shall", "must", "or", "as", "an", "all"}
+
+# File name endings that describe the document type rather than its subject
+FAMILY_SUFFIXES = ("policy", "standard", "procedure", "politique", "norme")
+
+def _slug(text):
+    """Lowercase, accent-free text with runs of other characters turned into "-" """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return re.sub(r"[^a-z0-9]+", "-", text).strip("-")
+
+def _stem(fname):
+    """File name without directory and document extensions ("x.docx.pdf" -> "x")"""
+    name = os.path.basename(fname)
+    while True:
+        root, ext = os.path.splitext(name)
+        if ext.lower() not in (".pdf", ".docx", ".doc"):
+            return name
+        name = root
+
+def detect_language(fname, text=""):
+    """
+    Language of a document: "fr"/"en" from a "_fr"/"_en" file name suffix,
+    otherwise from the function words of its text, or None without either
+    """
+    match = re.search(r"[_\-. ](fr|en)$", _stem(fname).lower())
+    if match:
+        return match.group(1)
+    words = re.findall(r"[^\W\d_]+", text[:20000].lower())
+    french = sum(1 for word in words if word in FRENCH_WORDS)
+    english = sum(1 for word in words if word in ENGLISH_WORDS)
+    if not french and not english:
+        return None
+    return "fr" if french > english else "en"
+
+def document_family(fname):
+    """
+    Subject of a document derived from its file name, e.g.
+    "Access-Control-Policy.docx.pdf" -> "access-control", "Loi_18-07_fr.pdf" -> "loi-18-07"
+    """
+    family = _slug(re.sub(r"[_\-. ](fr|en)$", "", _stem(fname), flags=re.IGNORECASE))
+    for suffix in FAMILY_SUFFIXES:
+        if family.endswith("-" + suffix):
+            return family[:-len(suffix) - 1]
+    return family
+
+def _as_list(key, values):
+    if values is None:
+        return []
+    if isinstance(values, str):
+        values = values.split(",")
+    elif not isinstance(values, (list, tuple)) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f"Search filter {key!r} must be a string or a list of strings")
+    return [value.strip() for value in values if value.strip()]
+
+def normalize_filters(filters):
+    """
+    Cleans a {"source"|"language"|"family": value or list} filter, dropping
+    empty keys; returns None when nothing is filtered
+    Raises ValueError for unknown keys and values that are not strings
+    """
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("Search filters must be an object of source/language/family values")
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown search filter(s) {sorted(unknown)}, expected {FILTER_KEYS}")
+    cleaned = {key: _as_list(key, filters.get(key)) for key in FILTER_KEYS}
+    cleaned = {key: values for key, values in cleaned.items() if values}
+    return cleaned or None
+
+def matches_filters(fname, metadata, filters):
+    """
+    Whether a file passes a normalized filter: any value of a key may match
+    (sources and families by case-insensitive substring, languages exactly)
+    and every filtered key must match
+    """
+    for key, values in filters.items():
+        if key == "language":
+            if (metadata.get("language") or "") not in {value.lower() for value in values}:
+                return False
+            continue
+        target = _slug(fname) if key == "source" else (metadata.get("family") or document_family(fname))
+        if not any(_slug(value) in target for value in values):
+            return False
+    return True
+
+class PartitionedIndex:
+    """
+    Per-file views of a FAISS store, so a filtered search only scores the
+    vectors of the files it is restricted to
+    The catalog maps every file to its language, family and chunk ids (as
+    stored in the manifest); a filtered search runs on the store's own index
+    with an id selector over the positions of those chunks, so quantized and
+    memory-mapped indexes are searched as they are
+    """
+    def __init__(self, vectordb, catalog=None):
+        self.vectordb = vectordb
+        if catalog is None:
+            # Stores without a manifest: group chunks by the file in their id
+            catalog = {}
+            for chunk_id in vectordb.index_to_docstore_id.values():
+                fname = str(chunk_id).rpartition(":")[0]
+                entry = catalog.setdefault(fname, {
+                    "language": detect_language(fname),
+                    "family": document_family(fname),
+                    "chunk_ids": [],
+                })
+                entry["chunk_ids"].append(chunk_id)
+        self.catalog = catalog
+        self._positions = None
+        self._stored = None
+        self._lock = threading.Lock()
+
+    def positions(self):
+        """Map of docstore id -> position in the FAISS index"""
+        with self._lock:
+            if self._positions is None:
+                self._positions = {doc_id: pos for pos, doc_id in self.vectordb.index_to_docstore_id.items()}
+            return self._positions
+
+    def vectors(self, ids):
+        """The store's exact vectors for a list of docstore ids"""
+        index = self.vectordb.index
+        positions = [self.positions()[doc_id] for doc_id in ids]
+        vectors_path = getattr(self.vectordb, "vectors_path", None)
+        if vectors_path:
+            # Compact stores: decoding the quantized index would be lossy
+            with self._lock:
+                if self._stored is None:
+                    self._stored = np.load(vectors_path, mmap_mode="r")
+            return np.asarray(self._stored[positions], dtype=np.float32).reshape(len(positions), index.d)
+        try:
+            vectors = [index.reconstruct(int(pos)) for pos in positions]
+        except RuntimeError:
+            # IVF indexes need a direct map to reconstruct vectors by position
+            import faiss
+            with self._lock:
+                faiss.extract_index_ivf(index).make_direct_map()
+            vectors = [index.reconstruct(int(pos)) for pos in positions]
+        return np.asarray(vectors, dtype=np.float32).reshape(len(positions), index.d)
+
+    def matching_files(self, filters):
+        """
+        Files a filter routes a search to, as a sorted tuple, or None when
+        every file matches (the full index is searched)
+        """
+        filters = normalize_filters(filters)
+        if filters is None:
+            return None
+        files = tuple(sorted(fname for fname, metadata in self.catalog.items()
+                             if matches_filters(fname, metadata, filters)))
+        return None if len(files) == len(self.catalog) else files
+
+    def file_positions(self, files):
+        """Sorted index positions of the chunks of the given files, each once"""
+        positions = self.positions()
+        return sorted({positions[chunk_id] for fname in files
+                       for chunk_id in self.catalog.get(fname, {}).get("chunk_ids", [])
+                       if chunk_id in positions})
+
+    def search(self, vectors, k, files):
+        """Docstore ids of the k nearest chunks per query vector within the given files"""
+        import faiss
+        vectors = np.asarray(vectors, dtype=np.float32)
+        # A chunk merged from several files is listed by each of them but selected once
+        selected = np.asarray(self.file_positions(files), dtype=np.int64)
+        if not len(selected):
+            return [[] for _ in range(len(vectors))]
+
+        index = self.vectordb.index
+        selector = faiss.IDSelectorBatch(len(selected), faiss.swig_ptr(selected))
+        try:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+        except RuntimeError:
+            params = faiss.SearchParameters(sel=selector)
+        _, indices = index.search(vectors, min(k, len(selected)), params=params)
+
+        index_to_docstore_id = self.vectordb.index_to_docstore_id
+        return [[index_to_docstore_id[int(pos)] for pos in row if pos != -1] for row in indices]
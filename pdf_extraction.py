@@ -0,0 +1,130 @@
+# pdf_extraction.py
+
+import json
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from pypdf import PdfReader
+
+load_dotenv()
+
+# Extracted page text, one JSON file per PDF content hash
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(".cache", "pdf_text"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Large PDFs are split into page ranges of this size so they parse in parallel
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+
+def file_sha256(path):
+    """
+    Returns the SHA-256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _cache_path(sha):
+    return os.path.join(PDF_CACHE_DIR, f"{sha}.json")
+
+def _load_cached_pages(sha):
+    try:
+        with open(_cache_path(sha), "r", encoding="utf-8") as f:
+            return json.load(f)["pages"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _save_cached_pages(sha, pages):
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        path = _cache_path(sha)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error caching extracted text: {str(e)}")
+
+def _page_count(path):
+    return len(PdfReader(path).pages)
+
+def iter_page_texts(source):
+    """
+    Yields the text of each page of a PDF given as a path or a seekable binary
+    stream, one page at a time, so large documents are never parsed whole
+    """
+    reader = PdfReader(source)
+    for page in reader.pages:
+        yield page.extract_text()
+
+def _extract_page_range(path, start, end):
+    """Extracts the text of pages [start, end) of a PDF (runs in a worker process)"""
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+def _try_extract(path, start, end):
+    try:
+        return _extract_page_range(path, start, end)
+    except Exception as e:
+        print(f"Error loading {os.path.basename(path)}: {str(e)}")
+        return None
+
+def extract_pages(paths, workers=None):
+    """
+    Returns the text of every page of each PDF, as {path: [page text, ...]}
+    Unchanged PDFs are served from the extraction cache; the rest are parsed
+    in a process pool, one task per page range. PDFs that fail to parse are
+    reported and left out
+    """
+    workers = workers or INGEST_WORKERS
+    results = {}
+    pending = {}
+    for path in paths:
+        try:
+            sha = file_sha256(path)
+            pages = _load_cached_pages(sha)
+            if pages is not None:
+                results[path] = pages
+            else:
+                pending[path] = (sha, _page_count(path))
+        except Exception as e:
+            print(f"Error loading {os.path.basename(path)}: {str(e)}")
+    
+    tasks = [(path, start, min(start + PAGES_PER_TASK, count))
+             for path, (_, count) in pending.items()
+             for start in range(0, count, PAGES_PER_TASK)]
+    
+    if workers <= 1 or len(tasks) <= 1:
+        chunks = [_try_extract(*task) for task in tasks]
+    else:
+        # Spawned rather than forked: the caller (the app's warm-up thread) runs
+        # alongside server and model threads a forked child could deadlock on
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as executor:
+            futures = [executor.submit(_extract_page_range, *task) for task in tasks]
+            chunks = []
+            for task, future in zip(tasks, futures):
+                try:
+                    chunks.append(future.result())
+                except Exception as e:
+                    print(f"Error loading {os.path.basename(task[0])}: {str(e)}")
+                    chunks.append(None)
+    
+    extracted = {}
+    for (path, _, _), pages in zip(tasks, chunks):
+        extracted.setdefault(path, []).append(pages)
+    for path, parts in extracted.items():
+        if any(part is None for part in parts):
+            continue
+        pages = [text for part in parts for text in part]
+        _save_cached_pages(pending[path][0], pages)
+        results[path] = pages
+    # PDFs without pages never reach the pool
+    for path, (sha, count) in pending.items():
+        if count == 0:
+            _save_cached_pages(sha, [])
+            results[path] = []
+    
+    return results
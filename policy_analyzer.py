@@ -1,22 +1,30 @@
 from langchain.prompts import PromptTemplate
-import requests
-from datetime import datetime
-from utils import load_documents, create_vector_store
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from utils import update_vector_store, update_coverage_index, index_version, load_sparse_index, load_catalog, count_tokens, truncate_to_tokens, CHARS_PER_TOKEN
+from retrieval import Retriever
+from context_assembly import ContextAssembler
+from gap_analysis import DEFAULT_THRESHOLD, query_coverage
+from base_analyzer import BaseAnalyzer, unique_items, PROMPT_TOKENS
+from llm_client import API_URL, LLM_MODEL
 import os
-from langchain.document_loaders import PyPDFLoader
+from pdf_extraction import iter_page_texts
+import metrics
 
-# Constants
-API_URL = 'https://openrouter.ai/api/v1/chat/completions'
+# Policies longer than one section are analyzed section by section, then merged
+SECTION_TOKENS = 1500
+MAP_CONCURRENCY = int(os.getenv("POLICY_MAP_CONCURRENCY", "4"))
 
-class PolicyAnalyzer:
-    def __init__(self, api_key):
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "HTTP-Referer": "https://localhost:5000",
-            "Content-Type": "application/json"
-        }
+class PolicyAnalyzer(BaseAnalyzer):
+    def __init__(self, api_key, response_cache=None, llm_client=None, api_url=API_URL, model=LLM_MODEL):
+        super().__init__(api_key, response_cache=response_cache, llm_client=llm_client,
+                         api_url=api_url, model=model)
         self.internal_db = None
         self.global_db = None
+        self.global_retriever = None
+        self.global_context = None
+        self.coverage = None
         
         # Initialize RAG prompt templates for both languages
         self.analysis_templates = {
@@ -81,86 +89,245 @@ class PolicyAnalyzer:
                 Réponse:"""
             )
         }
+        
+        # Map step: compare one section of a long policy
+        self.section_templates = {
+            'en': PromptTemplate(
+                input_variables=["context", "section", "index"],
+                template="""
+                You are a policy compliance analyzer. Below is section {index} of an internal policy
+                and the global regulations most relevant to it. Please answer in English.
 
-    def query_llm(self, prompt, language='en'):
-        """Query the LLM through OpenRouter API"""
-        try:
-            payload = {
-                "model": "mistralai/mistral-7b-instruct",
-                "messages": [{"role": "user", "content": prompt}]
-            }
-            
-            response = requests.post(API_URL, headers=self.headers, json=payload)
-            response.raise_for_status()
+                Global regulations: {context}
+                
+                Policy section: {section}
+                
+                Concisely list:
+                - Requirements of the global regulations that this section covers
+                - Requirements of the global regulations that this section misses or only partially covers
+                
+                Response:"""
+            ),
+            'fr': PromptTemplate(
+                input_variables=["context", "section", "index"],
+                template="""
+                Vous êtes un analyseur de conformité des politiques. Voici la section {index} d'une politique interne
+                et les réglementations globales les plus pertinentes. Veuillez répondre en français.
+
+                Réglementations globales: {context}
+                
+                Section de la politique: {section}
+                
+                Listez de manière concise:
+                - Les exigences des réglementations globales couvertes par cette section
+                - Les exigences des réglementations globales manquantes ou partiellement couvertes dans cette section
+                
+                Réponse:"""
+            )
+        }
+        
+        # Reduce step: the per-section findings become the context of the final analysis
+        self.merge_questions = {
+            'en': "The context contains section-by-section findings for a single internal policy. "
+                  "Merge them into one analysis of the whole policy against the global regulations, "
+                  "removing duplicates and identifying missing requirements.",
+            'fr': "Le contexte contient les constats section par section d'une même politique interne. "
+                  "Fusionnez-les en une seule analyse de l'ensemble de la politique par rapport aux réglementations globales, "
+                  "en supprimant les doublons et en identifiant les exigences manquantes."
+        }
+
+    def initialize_databases(self, internal_path, global_path):
+        """Initialize vector databases for both internal and global policies
+        
+        Stored indexes are reused as long as the documents and index config
+        they were built from are unchanged.
+        """
+        self.internal_db = update_vector_store(internal_path, is_public=False)
+        self.global_db = update_vector_store(global_path, is_public=True)
+        self.global_retriever = Retriever(self.global_db, index_version("public_db"), load_sparse_index("public_db"),
+                                         load_catalog("public_db"))
+        self.global_context = ContextAssembler(self.global_retriever)
+        self.coverage = update_coverage_index(self.global_db, self.internal_db)
+
+    def coverage_report(self, source=None, threshold=DEFAULT_THRESHOLD, uncovered_only=False):
+        """Look up which global requirements are covered by internal policies
+        
+        Served from the coverage index precomputed when the stores were built,
+        so no retrieval or LLM call is needed.
+        
+        Args:
+            source (str): Only include global chunks from matching PDFs, e.g. "Loi_18-07"
+            threshold (float): Minimum similarity for a requirement to count as covered
+            uncovered_only (bool): Only return requirements below the threshold
             
-            return response.json()['choices'][0]['message']['content']
+        Returns:
+            dict: The matching entries, each with its text, best internal matches and
+            covered flag, plus the coverage rate of the selection
+        """
+        if self.coverage is None:
+            raise ValueError("Coverage index not built. Call initialize_databases first.")
+        
+        selected = query_coverage(self.coverage, source=source, threshold=threshold)
+        covered = sum(1 for entry in selected if entry["covered"])
+        entries = [entry for entry in selected if not (uncovered_only and entry["covered"])]
+        for entry in entries:
+            entry["text"] = self.global_db.docstore.search(entry["global_id"]).page_content
+        
+        return {
+            "entries": entries,
+            "total": len(selected),
+            "covered": covered,
+            "coverage_rate": covered / len(selected) if selected else 0.0,
+            "threshold": threshold
+        }
+
+    def uncovered_requirements(self, source=None, threshold=DEFAULT_THRESHOLD):
+        """Global requirements with no sufficiently similar internal policy text"""
+        return self.coverage_report(source=source, threshold=threshold, uncovered_only=True)["entries"]
+
+    def _iter_policy_pages(self, source):
+        """Page texts of a policy document (file path or binary stream), parsed one page at a time"""
+        pages = iter_page_texts(source)
+        while True:
+            with metrics.timed("pdf_parse"):
+                page = next(pages, None)
+            if page is None:
+                return
+            yield page
+
+    def _load_policy_text(self, new_policy_path):
+        """Load the text of a single policy document, or None if it can't be read
+        
+        The document can be a file path or a binary stream such as an upload
+        """
+        try:
+            pages = list(self._iter_policy_pages(new_policy_path))
+            if not pages:
+                raise ValueError("No policy document found")
+            return "\n".join(pages)
         except Exception as e:
-            print(f"Error querying LLM: {str(e)}")
+            print(f"Error loading policy document: {str(e)}")
             return None
 
-    def initialize_databases(self, internal_path, global_path):
-        """Initialize vector databases for both internal and global policies"""
-        internal_docs = load_documents(internal_path)
-        global_docs = load_documents(global_path)
+    def _format_with_context(self, template, chunks, **variables):
+        """Format a template, packing the selected chunks into the budget the rest of the prompt leaves"""
+        with metrics.timed("prompt_format"):
+            overhead = count_tokens(template.format(context="", **variables))
+            context_budget = PROMPT_TOKENS - overhead
+            if context_budget <= 0:
+                raise ValueError("Policy text does not fit in the model context")
+            return template.format(context=self.global_context.pack(chunks, context_budget), **variables)
+
+    def _split_policy(self, policy_text):
+        """Split a policy into sections of at most SECTION_TOKENS tokens"""
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=SECTION_TOKENS * CHARS_PER_TOKEN,
+            chunk_overlap=0
+        )
+        return [section for section in splitter.split_text(policy_text) if section.strip()]
+
+    def _iter_sections(self, pages):
+        """Split page texts into sections as the pages arrive
         
-        self.internal_db = create_vector_store(internal_docs, is_public=False)
-        self.global_db = create_vector_store(global_docs, is_public=True)
+        Only the text not yet cut into sections is held, at most about one
+        section plus one page
+        """
+        buffer = ""
+        for page in pages:
+            buffer = f"{buffer}\n{page}" if buffer else page
+            if len(buffer) > SECTION_TOKENS * CHARS_PER_TOKEN:
+                # The last piece may continue on the next page
+                *sections, buffer = self._split_policy(buffer) or [""]
+                yield from sections
+        yield from self._split_policy(buffer)
 
-    def analyze_new_policy(self, new_policy_path, language='en'):
-        """Analyze a new internal policy document against existing global regulations"""
-        try:
-            # Load single policy document
-            try:
-                loader = PyPDFLoader(new_policy_path)
-                new_policy = loader.load()
-                if not new_policy:
-                    raise ValueError("No policy document found")
-            except Exception as e:
-                print(f"Error loading policy document: {str(e)}")
-                return None
-            
+    def _analyze_sections(self, sections, language='en', filters=None):
+        """Map step: compare every section with its own global context, concurrently
+        
+        sections may be a stream: each group of MAP_CONCURRENCY sections is
+        retrieved for in one batched search and sent to the LLM as soon as it
+        has arrived
+        """
+        template = self.section_templates[language]
+        sections = iter(sections)
+        # Workers' LLM calls count towards the request's stage timings
+        run_analysis = metrics.bind(self._run_analysis)
+        futures = []
+        with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+            for group in iter(lambda: list(islice(sections, MAP_CONCURRENCY)), []):
+                for section, chunks in zip(group, self.global_context.select(group, filters)):
+                    prompt = self._format_with_context(template, chunks, section=section, index=len(futures) + 1)
+                    futures.append(executor.submit(run_analysis, prompt, language))
+            reports = [future.result() for future in futures]
+        
+        findings = [
+            f"Section {i + 1}:\n{report['analysis']}"
+            for i, report in enumerate(reports) if report
+        ]
+        if not findings:
+            raise ValueError("No section of the policy could be analyzed")
+        return findings
+
+    def _build_analysis_prompt(self, policy_text, language='en', relevant_globals=None, filters=None):
+        """Build the final analysis prompt for a policy given as text
+        
+        relevant_globals (chunks from the context assembler) may be passed in
+        when retrieval for a short policy was already done in a batch.
+        filters restricts the global regulations compared with, e.g.
+        {"source": "Loi_18-07"} or {"language": "fr"}.
+        """
+        return self._build_sections_prompt(self._split_policy(policy_text), language, relevant_globals, filters)
+
+    def _build_sections_prompt(self, sections, language='en', relevant_globals=None, filters=None):
+        """Build the final analysis prompt for a policy given as its sections
+        
+        Short (single-section) policies are compared directly with their most
+        relevant global regulations. Longer ones are compared section by
+        section, concurrently, starting while later sections are still being
+        read; the section findings then become the context of the final prompt.
+        """
+        sections = iter(sections)
+        first = next(sections, None)
+        if first is None:
+            raise ValueError("No policy text found")
+        second = next(sections, None)
+        template = self.analysis_templates[language]
+        
+        if second is None:
             # Get relevant global policies
-            relevant_globals = self.global_db.similarity_search(
-                new_policy[0].page_content, 
-                k=5
-            )
-            
-            # Construct analysis prompt
-            context = "\n".join([doc.page_content for doc in relevant_globals])
-            question = f"Compare this internal policy:\n{new_policy[0].page_content}\n"
+            if relevant_globals is None:
+                relevant_globals = self.global_context.select([first], filters)[0]
+            question = f"Compare this internal policy:\n{first}\n"
             question += "with the global regulations and identify missing requirements."
-            
-            formatted_prompt = self.analysis_templates[language].format(
-                context=context,
-                question=question
-            )
-            
-            # Get analysis from LLM
-            llm_response = self.query_llm(formatted_prompt, language)
-            
-            return self._format_analysis_report(llm_response)
+            return self._format_with_context(template, relevant_globals, question=question)
+        
+        findings = self._analyze_sections(chain([first, second], sections), language, filters)
+        question = self.merge_questions[language]
+        overhead = count_tokens(template.format(context="", question=question))
+        per_finding = max((PROMPT_TOKENS - overhead) // len(findings), 0)
+        context = "\n\n".join(truncate_to_tokens(finding, per_finding) for finding in findings)
+        return template.format(context=context, question=question)
+
+    def analyze_new_policy(self, new_policy_path, language='en', filters=None):
+        """Analyze a new internal policy document against existing global regulations"""
+        try:
+            # Sections are analyzed while the rest of the document is parsed
+            sections = self._iter_sections(self._iter_policy_pages(new_policy_path))
+            formatted_prompt = self._build_sections_prompt(sections, language, filters=filters)
+            return self._run_analysis(formatted_prompt, language)
             
         except Exception as e:
             print(f"Error in policy analysis: {str(e)}")
             return None
 
-    def _format_analysis_report(self, llm_response):
-        """Format the analysis report in a structured way"""
-        if not llm_response:
-            return None
-            
-        return {
-            "analysis": llm_response,
-            "timestamp": datetime.now().isoformat(),
-            "status": "completed"
-        }
-
-    def analyze_new_policy_from_text(self, policy_text, language='en'):
+    def analyze_new_policy_from_text(self, policy_text, language='en', filters=None):
         """Analyze a new internal policy from text input against existing global regulations
         
         Args:
             policy_text (str): The text content of the policy to analyze
             language (str): The language for the analysis ('en' or 'fr')
+            filters (dict): Only compare with global regulations matching these
+                source/language/family values
             
         Returns:
             dict: Analysis report containing the comparison results
@@ -169,27 +336,63 @@ class PolicyAnalyzer:
             if not policy_text:  # Only check for empty/None input
                 return None
                 
-            # Get relevant global policies
-            relevant_globals = self.global_db.similarity_search(
-                policy_text, 
-                k=5
-            )
+            formatted_prompt = self._build_analysis_prompt(policy_text, language, filters=filters)
+            return self._run_analysis(formatted_prompt, language)
             
-            # Construct analysis prompt
-            context = "\n".join([doc.page_content for doc in relevant_globals])
-            question = f"Compare this internal policy:\n{policy_text}\n"
-            question += "with the global regulations and identify missing requirements."
-            
-            formatted_prompt = self.analysis_templates[language].format(
-                context=context,
-                question=question
+        except Exception as e:
+            print(f"Error in policy analysis from text: {str(e)}")
+            return None
+
+    def analyze_policies(self, policy_texts, language='en', filters=None):
+        """Analyze several policies given as text
+        
+        Duplicates are analyzed once, the global regulations for all short
+        policies are retrieved in a single batched search, and the LLM calls
+        run with bounded concurrency.
+        
+        Returns:
+            list: One analysis report (or None on failure) per input text
+        """
+        unique = [text for text in unique_items(policy_texts) if text]
+        short = [text for text in unique if len(self._split_policy(text)) <= 1]
+        retrieved = dict(zip(short, self.global_context.select(short, filters)))
+        
+        def analyze(policy_text):
+            if not policy_text:
+                return None
+            formatted_prompt = self._build_analysis_prompt(
+                policy_text, language, relevant_globals=retrieved.get(policy_text), filters=filters
             )
-            
-            # Get analysis from LLM
-            llm_response = self.query_llm(formatted_prompt, language)
-            
-            return self._format_analysis_report(llm_response)
-            
+            return self._run_analysis(formatted_prompt, language)
+        
+        return self._analyze_batch(policy_texts, analyze)
+
+    def stream_new_policy(self, new_policy_path, language='en', filters=None):
+        """Stream the analysis of a policy document
+        
+        Yields ("token", text) events followed by ("done", report) or ("error", message)
+        """
+        try:
+            sections = self._iter_sections(self._iter_policy_pages(new_policy_path))
+            formatted_prompt = self._build_sections_prompt(sections, language, filters=filters)
+        except Exception as e:
+            print(f"Error in policy analysis: {str(e)}")
+            yield "error", "Failed to analyze policy document"
+            return
+        yield from self._stream_analysis(formatted_prompt, language)
+
+    def stream_new_policy_from_text(self, policy_text, language='en', filters=None):
+        """Stream the analysis of a policy given as text
+        
+        Yields ("token", text) events followed by ("done", report) or ("error", message)
+        """
+        if not policy_text:
+            yield "error", "No policy text provided"
+            return
+        try:
+            formatted_prompt = self._build_analysis_prompt(policy_text, language, filters=filters)
         except Exception as e:
             print(f"Error in policy analysis from text: {str(e)}")
-            return None
\ No newline at end of file
+            yield "error", "Failed to analyze policy text"
+            return
+        yield from self._stream_analysis(formatted_prompt, language)
\ No newline at end of file
@@ -0,0 +1,145 @@
+# retrieval.py
+
+import os
+import numpy as np
+from dotenv import load_dotenv
+from cache import LRUCache, normalize_query
+from sparse_index import reciprocal_rank_fusion
+from partitions import PartitionedIndex
+import metrics
+
+load_dotenv()
+
+# Top-k results shared by every retriever in the process, keyed by
+# (index version, normalized query, k[, searched files])
+search_cache = LRUCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "2048")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_MB", "64")) * 1024 * 1024
+)
+metrics.register_cache("search", search_cache)
+
+# "hybrid" fuses dense and BM25 rankings when a sparse index is available
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion, as a multiple of k
+HYBRID_FETCH_FACTOR = int(os.getenv("HYBRID_FETCH_FACTOR", "4"))
+
+class Retriever:
+    """
+    Wraps a FAISS vector store and caches its top-k results per index version
+    With a BM25 sparse index, dense and keyword rankings are fused with
+    reciprocal-rank fusion so exact references ("article 38", "CIS 5.3")
+    are found even when the embedding model misses them
+    Searches accept filters ({"source"|"language"|"family": values}) and
+    then only scan the per-file partitions the filter selects
+    """
+    def __init__(self, vectordb, version=None, sparse_index=None, catalog=None):
+        self.vectordb = vectordb
+        # Without a manifest fingerprint, fall back to the identity of the loaded index
+        self.version = version or f"{id(vectordb)}:{vectordb.index.ntotal}"
+        self.sparse_index = sparse_index if RETRIEVAL_MODE == "hybrid" else None
+        self.partitions = PartitionedIndex(vectordb, catalog)
+        self._sparse_ids = None
+
+    def _cache_key(self, kind, query, k, files):
+        key = (self.version,) + kind + (normalize_query(query), k)
+        return key if files is None else key + (files,)
+
+    def similarity_search(self, query, k=4, filters=None):
+        """Returns the k chunks most similar to the query, within the files matching filters"""
+        files = self.partitions.matching_files(filters)
+        key = self._cache_key((), query, k, files)
+        cached = search_cache.get(key)
+        if cached is not None:
+            return list(cached)
+        
+        with metrics.timed("retrieval"):
+            if self.sparse_index is None and files is None:
+                docs = self.vectordb.similarity_search(query, k=k)
+            else:
+                docs = self.documents(self._search_ids([query], self.embed_queries([query]), k, files)[0])
+        search_cache.set(key, docs)
+        return list(docs)
+
+    def documents(self, ids):
+        """The stored chunks for a list of docstore ids"""
+        return [self.vectordb.docstore.search(doc_id) for doc_id in ids]
+
+    def _dense_ids(self, vectors, k, files=None):
+        """Docstore ids of the k nearest chunks for each query vector"""
+        if files is not None:
+            return self.partitions.search(vectors, k, files)
+        _, indices = self.vectordb.index.search(np.asarray(vectors, dtype=np.float32), k)
+        return [
+            [self.vectordb.index_to_docstore_id[int(idx)] for idx in row if idx != -1]
+            for row in indices
+        ]
+
+    def _sparse_mask(self, files):
+        """Boolean mask of the sparse index documents belonging to the given files"""
+        if files is None:
+            return None
+        if self._sparse_ids is None:
+            self._sparse_ids = np.array(self.sparse_index.ids)
+        # Chunks merged from several files are listed under each of them in the catalog
+        allowed = [chunk_id for fname in files for chunk_id in self.partitions.catalog[fname]["chunk_ids"]]
+        return np.isin(self._sparse_ids, allowed)
+
+    def _search_ids(self, queries, vectors, k, files=None):
+        """Ids of the k best chunks per query, fusing in the BM25 ranking if available"""
+        if files == ():
+            return [[] for _ in queries]
+        if self.sparse_index is None:
+            return self._dense_ids(vectors, k, files)
+        
+        fetch_k = k * HYBRID_FETCH_FACTOR
+        mask = self._sparse_mask(files)
+        results = []
+        for query, dense_ids in zip(queries, self._dense_ids(vectors, fetch_k, files)):
+            sparse_ids = [doc_id for doc_id, _ in self.sparse_index.search(query, fetch_k, mask)]
+            results.append(reciprocal_rank_fusion([dense_ids, sparse_ids])[:k])
+        return results
+
+    def embed_queries(self, queries):
+        """Embeds queries in one batched forward pass"""
+        embedder = self.vectordb.embedding_function
+        # Single queries go through embed_query, which has its own cache
+        if len(queries) == 1:
+            return np.asarray([embedder.embed_query(queries[0])], dtype=np.float32)
+        with metrics.timed("embed_query"):
+            if hasattr(embedder, "embed"):
+                return embedder.embed(queries)
+            return np.asarray(embedder.embed_documents(queries), dtype=np.float32)
+
+    def batch_search_ids(self, queries, k=4, vectors=None, filters=None):
+        """
+        Returns the docstore ids of the k best chunks for each query
+        Uncached queries are embedded together (unless their vectors are
+        given) and searched as one matrix query
+        """
+        files = self.partitions.matching_files(filters)
+        results = [None] * len(queries)
+        missing = []
+        for i, query in enumerate(queries):
+            cached = search_cache.get(self._cache_key(("ids",), query, k, files))
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                missing.append(i)
+        
+        if missing:
+            with metrics.timed("retrieval"):
+                missing_queries = [queries[i] for i in missing]
+                if vectors is None:
+                    missing_vectors = self.embed_queries(missing_queries)
+                else:
+                    missing_vectors = np.asarray(vectors, dtype=np.float32)[missing]
+                found = self._search_ids(missing_queries, missing_vectors, k, files)
+                for i, ids in zip(missing, found):
+                    search_cache.set(self._cache_key(("ids",), queries[i], k, files), ids)
+                    results[i] = list(ids)
+        
+        return results
+
+    def batch_similarity_search(self, queries, k=4, filters=None):
+        """Returns the k most similar chunks for each query"""
+        return [self.documents(ids) for ids in self.batch_search_ids(queries, k, filters=filters)]
@@ -0,0 +1,127 @@
+# sparse_index.py
+
+import json
+import os
+import re
+import unicodedata
+import numpy as np
+
+SPARSE_FILE = "sparse.npz"
+SPARSE_VOCAB_FILE = "sparse_vocab.json"
+
+# Dotted/dashed numbers ("5.3", "18-07") are kept whole so references match exactly
+TOKEN_PATTERN = re.compile(r"\d+(?:[.\-]\d+)+|\w+", re.UNICODE)
+
+def tokenize(text):
+    """
+    Lowercases, strips accents and splits text into terms
+    """
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return TOKEN_PATTERN.findall(text)
+
+class BM25Index:
+    """
+    Okapi BM25 over precomputed postings stored as flat NumPy arrays (CSR
+    layout: the postings of term t are docs[offsets[t]:offsets[t + 1]])
+    """
+    def __init__(self, ids, vocab, offsets, docs, tfs, doc_lengths, k1=1.5, b=0.75):
+        self.ids = ids
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        
+        n = len(ids)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if n else 1.0
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, ids, texts):
+        """Builds the index from docstore ids and their texts"""
+        term_ids = {}
+        postings = []
+        doc_lengths = np.zeros(len(ids), dtype=np.float32)
+        
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term = term_ids.setdefault(token, len(term_ids))
+                if term == len(postings):
+                    postings.append([])
+                postings[term].append((doc, count))
+        
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        docs = np.fromiter((doc for p in postings for doc, _ in p), dtype=np.int32, count=int(offsets[-1]))
+        tfs = np.fromiter((count for p in postings for _, count in p), dtype=np.float32, count=int(offsets[-1]))
+        return cls(list(ids), term_ids, offsets, docs, tfs, doc_lengths)
+
+    def scores(self, query):
+        """BM25 score of every document for the query"""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.vocab.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.docs[start:end]
+            tfs = self.tfs[start:end]
+            scores[docs] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+        return scores
+
+    def search(self, query, k=10, mask=None):
+        """
+        Ids and scores of the k best matching documents (score > 0)
+        mask (a boolean array over the documents) restricts the candidates
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        """Writes the postings next to a vector store"""
+        np.savez(
+            os.path.join(path, SPARSE_FILE),
+            offsets=self.offsets, docs=self.docs, tfs=self.tfs, doc_lengths=self.doc_lengths
+        )
+        with open(os.path.join(path, SPARSE_VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "vocab": self.vocab}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Loads postings written by save, or returns None if there are none"""
+        try:
+            arrays = np.load(os.path.join(path, SPARSE_FILE))
+            with open(os.path.join(path, SPARSE_VOCAB_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(meta["ids"], meta["vocab"], arrays["offsets"], arrays["docs"],
+                   arrays["tfs"], arrays["doc_lengths"])
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses several ranked id lists: each id scores sum(1 / (k + rank))
+    Returns ids ordered by fused score
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
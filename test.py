@@ -1,26 +1,23 @@
 import time
 from utils import *
-from main import initialize_system, retrieve_similar_chunks
+from main import retrieve_similar_chunks
 
 def test_system_performance(test_queries, docs_directory):
     """
-    Test system performance with multiple queries
+    Quick check of system performance with multiple queries
+    See benchmark.py for throughput, latency percentiles and scaled corpora
     """
-    # Initialize system
-    start_time = time.time()
-    public_db, private_db = initialize_system(docs_directory)
-    init_time = time.time() - start_time
-    
-    if not (public_db and private_db):
-        print("System initialization failed")
-        return
+    # Load (or build) the public store; the private store is left alone
+    start_time = time.perf_counter()
+    public_db = update_vector_store(docs_directory, is_public=True)
+    init_time = time.perf_counter() - start_time
     
     results = []
     for query in test_queries:
         # Measure retrieval time
-        start_time = time.time()
+        start_time = time.perf_counter()
         chunks = retrieve_similar_chunks(query, public_db)
-        retrieval_time = time.time() - start_time
+        retrieval_time = time.perf_counter() - start_time
         
         # Get number of relevant chunks
         num_chunks = len(chunks)
@@ -37,7 +34,7 @@ def test_system_performance(test_queries, docs_directory):
     print(f"\nQuery Performance:")
     for result in results:
         print(f"\nQuery: {result['query']}")
-        print(f"Retrieval time: {result['retrieval_time']:.2f} seconds")
+        print(f"Retrieval time: {result['retrieval_time'] * 1000:.1f} ms")
         print(f"Retrieved chunks: {result['num_chunks']}")
 
 if __name__ == "__main__":
@@ -49,7 +46,7 @@ if __name__ == "__main__":
     ]
     
     # Specify your documents directory
-    docs_directory = "./data/public"  # Create this directory and add PDF files
+    docs_directory = "./data/global"
     
     # Run performance test
     test_system_performance(test_queries, docs_directory)
\ No newline at end of file
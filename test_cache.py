@@ -0,0 +1,88 @@
+import sqlite3
+import pytest
+from cache import LRUCache, SQLiteResponseCache, normalize_query, response_key
+
+
+def test_normalize_query():
+    """Queries differing only in case and whitespace share a cache key"""
+    assert normalize_query("  Access   Control\nPolicy ") == "access control policy"
+    assert normalize_query(None) == ""
+
+def test_lru_evicts_least_recently_used():
+    """Entries beyond max_entries are evicted oldest-access first"""
+    cache = LRUCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_respects_memory_cap():
+    """Total size never exceeds max_bytes and oversized values are not stored"""
+    cache = LRUCache(max_entries=100, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert cache.stats()["bytes"] <= 10
+    assert cache.get("a") is None
+    
+    cache.set("big", "x" * 11)
+    assert cache.get("big") is None
+
+def test_lru_hit_miss_counters():
+    """Lookups are counted as hits or misses"""
+    cache = LRUCache()
+    cache.get("missing")
+    cache.set("key", [1, 2, 3])
+    cache.get("key")
+    cache.get("key")
+    
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert abs(stats["hit_rate"] - 2 / 3) < 1e-9
+
+def test_sqlite_response_cache_roundtrip(tmp_path):
+    """Stored reports are returned for the same model and prompt only"""
+    cache = SQLiteResponseCache(str(tmp_path / "responses.sqlite3"))
+    report = {"analysis": "text", "timestamp": "2024-01-01T00:00:00", "status": "completed"}
+    key = response_key("model-a", "prompt")
+    cache.set(key, report)
+    
+    assert cache.get(key) == report
+    assert cache.get(response_key("model-b", "prompt")) is None
+    assert cache.get(response_key("model-a", "other prompt")) is None
+
+def test_sqlite_response_cache_ttl_and_size(tmp_path):
+    """Expired entries are not returned and the oldest entries are evicted"""
+    path = str(tmp_path / "responses.sqlite3")
+    expired = SQLiteResponseCache(path, ttl=-1)
+    expired.set("key", {"analysis": "old"})
+    assert expired.get("key") is None
+    
+    cache = SQLiteResponseCache(path, max_entries=2)
+    for i in range(3):
+        cache.set(f"key-{i}", {"analysis": str(i)})
+    assert cache.get("key-0") is None
+    assert cache.get("key-2") == {"analysis": "2"}
+
+def test_sqlite_response_cache_closes_connections(tmp_path, monkeypatch):
+    """Every connection is closed once its read or write is done"""
+    opened = []
+    connect = sqlite3.connect
+    def tracking_connect(*args, **kwargs):
+        opened.append(connect(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    
+    cache = SQLiteResponseCache(str(tmp_path / "responses.sqlite3"))
+    cache.set("k", {"analysis": "a"})
+    assert cache.get("k") == {"analysis": "a"}
+    assert len(opened) == 3
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -0,0 +1,49 @@
+from langchain_core.documents import Document
+from chunking import reflow, structure_chunks, structure_split_documents
+
+HEADER = "JOURNAL OFFICIEL DE LA REPUBLIQUE ALGERIENNE N° 34 {page}"
+
+def law_pages():
+    return [
+        HEADER.format(page=1) + "\nTITRE I\nDISPOSITIONS GENERALES\n"
+        "Article 1er. — La présente loi a pour objet de fixer les règles.\n"
+        "Art. 2. — Le traitement des données doit se faire dans le respect\n"
+        "de la dignité humaine.\n3",
+        HEADER.format(page=2) + "\nde la vie privée et des libertés publiques.\n"
+        "Art. 3. — Aux fins de la présente loi, on entend par :\n4",
+        HEADER.format(page=3) + "\nArt. 38. — Le responsable du traitement met en œuvre les mesures.\n5",
+    ]
+
+def test_reflow_joins_word_per_line_text():
+    text = "a.\n \nReview\n \naccounts\n \nquarterly.\n \n \nb.\n \nDisable\n \naccounts."
+    assert reflow(text) == "a. Review accounts quarterly.\nb. Disable accounts."
+    assert reflow("Normal line of text\nAnother line") == "Normal line of text\nAnother line"
+
+def test_one_chunk_per_article_without_headers_or_page_numbers():
+    chunks = structure_chunks(law_pages())
+    assert [article for _, _, article in chunks] == ["Art. 1", "Art. 2", "Art. 3", "Art. 38"]
+    texts = [text for text, _, _ in chunks]
+    assert texts[0].startswith("TITRE I\nDISPOSITIONS GENERALES\nArticle 1er.")
+    assert texts[1].endswith("de la vie privée et des libertés publiques.")
+    assert not any("JOURNAL OFFICIEL" in text for text in texts)
+    assert [page for _, page, _ in chunks] == [0, 0, 1, 2]
+
+def test_long_sections_split_at_controls_within_cap():
+    lines = ["11.1 Gouvernance liée à la gestion des risques", "Contrôles :"]
+    lines += [f"{i}. Le service chargé de la GSI doit appliquer la mesure numéro {i}." * 3 for i in range(1, 9)]
+    lines += ["1 Sommaire ........................ 3"]
+    chunks = structure_chunks(["\n".join(lines)], max_chars=500)
+    assert len(chunks) > 1
+    assert all(len(text) <= 500 for text, _, _ in chunks)
+    assert {article for _, _, article in chunks} == {"§ 11.1"}
+    # Pieces break before a numbered control, never inside one
+    assert all(text[0].isdigit() for text, _, _ in chunks)
+    assert not any("Sommaire" in text for text, _, _ in chunks)
+
+def test_split_documents_keeps_file_metadata():
+    pages = [Document(page_content=text, metadata={"source": "data/global/Loi_18-07_fr.pdf", "page": i,
+                                                   "language": "fr", "family": "loi-18-07"})
+             for i, text in enumerate(law_pages())]
+    chunks = structure_split_documents(pages)
+    assert chunks[-1].metadata == {"source": "data/global/Loi_18-07_fr.pdf", "page": 2,
+                                   "language": "fr", "family": "loi-18-07", "article_id": "Art. 38"}
@@ -0,0 +1,56 @@
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from context_assembly import ContextAssembler, mmr, strip_overlap
+from retrieval import Retriever
+
+class KeywordEmbeddings(Embeddings):
+    """Deterministic bag-of-keywords vectors"""
+    VOCAB = ["password", "encryption", "backup", "audit", "network"]
+
+    def _vector(self, text):
+        v = np.array([text.lower().count(word) for word in self.VOCAB], dtype=np.float32) + 0.01
+        return (v / np.linalg.norm(v)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+def make_assembler(texts, ids, **kwargs):
+    docs = [Document(page_content=t, metadata={"source": f"data/internal/{i.split(':')[0]}", "page": 0})
+            for t, i in zip(texts, ids)]
+    vectordb = FAISS.from_documents(docs, KeywordEmbeddings(), ids=ids)
+    return ContextAssembler(Retriever(vectordb), **kwargs)
+
+def test_strip_overlap_removes_repeated_prefix():
+    previous = "Passwords must be rotated every ninety days by all users."
+    text = "rotated every ninety days by all users. Accounts are locked after five failures."
+    assert strip_overlap(previous, text) == "Accounts are locked after five failures."
+    assert strip_overlap("unrelated text entirely here", text) == text
+
+def test_mmr_prefers_diverse_chunks_and_drops_duplicates():
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    vectors = np.array([[1.0, 0.0], [1.0, 0.0], [0.8, 0.6]], dtype=np.float32)
+    assert mmr(query, vectors, max_items=3) == [0, 2]
+
+def test_select_dedupes_and_pack_cites_sources_within_budget():
+    texts = [
+        "password password policy for users",
+        "password password policy for users",
+        "encryption of backups and password storage",
+        "network segmentation rules",
+    ]
+    ids = ["a.pdf:0", "b.pdf:0", "a.pdf:1", "c.pdf:0"]
+    assembler = make_assembler(texts, ids, fetch_k=4, max_chunks=3)
+    chunks = assembler.select(["password policy"])[0]
+    chosen = [doc_id for doc_id, _ in chunks]
+    assert chosen[0] in ("a.pdf:0", "b.pdf:0")
+    assert not {"a.pdf:0", "b.pdf:0"} <= set(chosen)
+
+    context = assembler.pack(chunks, max_tokens=1000)
+    assert context.startswith("[1] ")
+    assert ", p. 1\n" in context
+    assert len(assembler.pack(chunks, max_tokens=20)) < len(context)
@@ -0,0 +1,37 @@
+from langchain_core.documents import Document
+from dedup import dedupe_chunks, near_duplicate_groups
+from utils import ids_by_file
+
+BOILERPLATE = ("Enforcement: Staff members found in policy violation may be subject to disciplinary action, "
+               "up to and including termination. Exceptions must be approved by the CISO in writing "
+               "and reviewed every twelve months by the information security committee.")
+
+def test_near_duplicates_are_grouped():
+    texts = [
+        BOILERPLATE,
+        "Laptops must use full disk encryption with keys escrowed by IT.",
+        BOILERPLATE.replace("twelve", "12"),
+        "Visitors are escorted at all times inside the data center.",
+    ]
+    groups = near_duplicate_groups(texts, threshold=0.7)
+    assert [members for members, _ in groups] == [[0, 2]]
+    assert near_duplicate_groups(texts, threshold=0) == []
+
+def test_dedupe_keeps_first_copy_with_sources():
+    docs = [
+        Document(page_content=BOILERPLATE, metadata={"source": "data/internal/A-Policy.pdf", "page": 3}),
+        Document(page_content="Unique access control text about account reviews.",
+                 metadata={"source": "data/internal/A-Policy.pdf", "page": 3}),
+        Document(page_content=BOILERPLATE, metadata={"source": "data/internal/B-Policy.pdf", "page": 5}),
+    ]
+    ids = ["A-Policy.pdf:0", "A-Policy.pdf:1", "B-Policy.pdf:0"]
+    kept, kept_ids, merges = dedupe_chunks(docs, ids)
+    assert kept_ids == ["A-Policy.pdf:0", "A-Policy.pdf:1"]
+    assert merges[0]["kept"] == "A-Policy.pdf:0" and merges[0]["merged"] == ["B-Policy.pdf:0"]
+    assert [s["source"] for s in kept[0].metadata["sources"]] == ["A-Policy.pdf", "B-Policy.pdf"]
+
+    # The kept chunk counts for both files, so neither loses it from its chunk ids
+    assert ids_by_file(kept_ids, kept) == {
+        "A-Policy.pdf": ["A-Policy.pdf:0", "A-Policy.pdf:1"],
+        "B-Policy.pdf": ["A-Policy.pdf:0"],
+    }
@@ -0,0 +1,23 @@
+import numpy as np
+from gap_analysis import normalize_rows, top_k_similar
+
+
+def test_top_k_similar_matches_full_matrix():
+    """Blocked top-k search returns the same result as the full similarity matrix"""
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(257, 16)).astype(np.float32)
+    targets = rng.normal(size=(131, 16)).astype(np.float32)
+    
+    indices, scores = top_k_similar(queries, targets, k=3, block_size=32)
+    
+    full = normalize_rows(queries) @ normalize_rows(targets).T
+    expected = np.argsort(-full, axis=1)[:, :3]
+    assert (indices == expected).all()
+    assert np.allclose(scores, np.take_along_axis(full, expected, axis=1), atol=1e-5)
+
+def test_top_k_similar_with_fewer_targets_than_k():
+    """k is capped at the number of targets"""
+    indices, scores = top_k_similar(np.eye(2, dtype=np.float32), np.eye(2, dtype=np.float32), k=5)
+    assert indices.shape == (2, 2)
+    assert list(indices[:, 0]) == [0, 1]
+    assert np.allclose(scores[:, 0], 1.0)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from gap_analysis import compute_coverage
+from index_storage import ReadOnlyStoreError, load_compact, save_compact
+from partitions import PartitionedIndex
+from test_context_assembly import KeywordEmbeddings
+
+# Enough vectors for "ivfpq" to train real PQ codebooks instead of falling back to SQ8
+N = 1100
+
+def make_store(n=N):
+    vectors = np.random.RandomState(0).rand(n, len(KeywordEmbeddings.VOCAB)).astype(np.float32)
+    ids = [f"doc.pdf:{i}" for i in range(n)]
+    pairs = [(f"chunk {i}", vector.tolist()) for i, vector in enumerate(vectors)]
+    metadatas = [{"source": "doc.pdf", "page": i // 10} for i in range(n)]
+    return FAISS.from_embeddings(pairs, KeywordEmbeddings(), metadatas=metadatas, ids=ids), vectors
+
+@pytest.fixture(scope="module")
+def compact_path(tmp_path_factory):
+    """Saves the test store once per index type and returns its directory"""
+    vectordb, _ = make_store()
+    paths = {}
+    def save(index_type):
+        if index_type not in paths:
+            paths[index_type] = str(tmp_path_factory.mktemp(index_type))
+            save_compact(vectordb, paths[index_type], index_type)
+        return paths[index_type]
+    return save
+
+@pytest.mark.parametrize("index_type", ["sq8", "ivf", "ivfpq"])
+def test_compact_store_round_trip(compact_path, index_type):
+    vectordb, vectors = make_store()
+    loaded = load_compact(compact_path(index_type), KeywordEmbeddings(), index_type)
+
+    assert loaded.index.ntotal == N
+    assert loaded.index_to_docstore_id == vectordb.index_to_docstore_id
+    doc = loaded.docstore.search("doc.pdf:42")
+    assert doc.page_content == "chunk 42" and doc.metadata == {"source": "doc.pdf", "page": 4}
+    found = loaded.similarity_search_by_vector(vectors[42].tolist(), k=10)
+    assert "chunk 42" in [doc.page_content for doc in found]
+
+    # The serving copy refuses updates and stays intact
+    with pytest.raises(ReadOnlyStoreError):
+        loaded.delete(["doc.pdf:0"])
+    with pytest.raises(ReadOnlyStoreError):
+        loaded.add_documents([Document(page_content="new")], ids=["new.pdf:0"])
+    assert loaded.index.ntotal == N
+
+def test_coverage_uses_exact_vectors_of_compact_stores(compact_path):
+    """Coverage scores and MMR vectors of a PQ store are those of the flat store"""
+    vectordb, vectors = make_store()
+    loaded = load_compact(compact_path("ivfpq"), KeywordEmbeddings(), "ivfpq")
+    internal, _ = make_store(n=50)
+
+    expected = compute_coverage(vectordb, internal)
+    matches = compute_coverage(loaded, internal)
+    assert [m["internal_id"] for m in matches] == [m["internal_id"] for m in expected]
+    np.testing.assert_allclose([m["score"] for m in matches], [m["score"] for m in expected], rtol=1e-6)
+
+    ids = ["doc.pdf:7", "doc.pdf:1000", "doc.pdf:42"]
+    np.testing.assert_array_equal(PartitionedIndex(loaded).vectors(ids), vectors[[7, 1000, 42]])
+
+def test_writable_store_is_updated_and_saved(tmp_path):
+    """The delete/add/save cycle update_vector_store runs on compact stores"""
+    index_type = "ivf"
+    vectordb, vectors = make_store()
+    save_compact(vectordb, str(tmp_path), index_type)
+
+    writable = load_compact(str(tmp_path), KeywordEmbeddings(), index_type, writable=True)
+    np.testing.assert_array_equal(writable.index.reconstruct_n(0, N), vectors)
+    writable.delete([f"doc.pdf:{i}" for i in range(10)])
+    writable.add_documents([Document(page_content="password audit", metadata={"source": "new.pdf"})],
+                           ids=["new.pdf:0"])
+    save_compact(writable, str(tmp_path), index_type)
+
+    loaded = load_compact(str(tmp_path), KeywordEmbeddings(), index_type)
+    ids = list(loaded.index_to_docstore_id.values())
+    assert len(ids) == loaded.index.ntotal == N - 9
+    assert ids[0] == "doc.pdf:10" and ids[-1] == "new.pdf:0"
+    assert loaded.docstore.search("doc.pdf:0") == "ID doc.pdf:0 not found."
+    assert loaded.docstore.search("new.pdf:0").metadata == {"source": "new.pdf"}
+    found = loaded.similarity_search("password audit", k=5)
+    assert "password audit" in [doc.page_content for doc in found]
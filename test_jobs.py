@@ -0,0 +1,54 @@
+import threading
+import time
+import pytest
+from jobs import JobManager, JobQueueFull, JobStore
+
+
+def wait_for(manager, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+def test_job_result_is_persisted(tmp_path):
+    """Completed jobs can be read back from a separate store on the same file"""
+    path = str(tmp_path / "jobs.sqlite3")
+    manager = JobManager(JobStore(path), max_workers=1)
+    job_id = manager.submit("policy", lambda text: {"analysis": text.upper()}, "ok")
+    
+    job = wait_for(manager, job_id)
+    assert job["status"] == "completed"
+    assert JobStore(path).get(job_id)["result"] == {"analysis": "OK"}
+    manager.shutdown()
+
+def test_failed_jobs_and_cleanup(tmp_path):
+    """Falsy results and exceptions mark the job failed; cleanup always runs"""
+    manager = JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), max_workers=1)
+    cleaned = []
+    
+    def boom():
+        raise RuntimeError("upstream down")
+    
+    empty_id = manager.submit("policy", lambda: None, cleanup=lambda: cleaned.append("empty"))
+    error_id = manager.submit("policy", boom, cleanup=lambda: cleaned.append("error"))
+    
+    assert wait_for(manager, empty_id)["status"] == "failed"
+    job = wait_for(manager, error_id)
+    assert job["status"] == "failed"
+    assert "upstream down" in job["error"]
+    manager.shutdown()
+    assert sorted(cleaned) == ["empty", "error"]
+
+def test_queue_is_bounded(tmp_path):
+    """Submitting beyond max_pending raises JobQueueFull"""
+    manager = JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), max_workers=1, max_pending=1)
+    release = threading.Event()
+    manager.submit("usecase", release.wait)
+    
+    with pytest.raises(JobQueueFull):
+        manager.submit("usecase", release.wait)
+    release.set()
+    manager.shutdown()
@@ -0,0 +1,135 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import pytest
+from llm_client import LLMClient, LLMError
+import metrics
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Chat-completions stub replaying the server's list of scripted statuses"""
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            status = server.statuses.pop(0) if server.statuses else 200
+        if server.delay:
+            time.sleep(server.delay)
+        
+        if payload.get("stream") and status == 200:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            self.wfile.write(b": keep-alive\n\n")
+            for token in ["stub ", "analysis"]:
+                chunk = {"choices": [{"delta": {"content": token}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        
+        body = json.dumps({
+            "choices": [{"message": {"content": "stub analysis"}}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 2}
+        }).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.statuses = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_client(server, **kwargs):
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/chat/completions"
+    kwargs.setdefault("backoff_base", 0.01)
+    return LLMClient("test-key", api_url=url, **kwargs)
+
+def test_complete_returns_message_content(stub_server):
+    """A successful completion returns the first choice's message content"""
+    client = make_client(stub_server)
+    assert client.complete("Hello") == "stub analysis"
+    assert stub_server.calls == 1
+
+def test_retries_on_rate_limit_and_server_errors(stub_server):
+    """429 and 5xx responses are retried until a successful response"""
+    stub_server.statuses = [429, 503]
+    client = make_client(stub_server, max_retries=3)
+    assert client.complete("Hello") == "stub analysis"
+    assert stub_server.calls == 3
+
+def test_records_retries_and_token_usage(stub_server):
+    """Retries are counted by status and usage tokens are added up"""
+    retries = metrics.llm_retries_total.value(reason="429")
+    prompt_tokens = metrics.llm_tokens_total.value(type="prompt")
+    stub_server.statuses = [429]
+    make_client(stub_server, max_retries=1).complete("Hello")
+    assert metrics.llm_retries_total.value(reason="429") == retries + 1
+    assert metrics.llm_tokens_total.value(type="prompt") == prompt_tokens + 7
+
+def test_gives_up_after_max_retries(stub_server):
+    """Persistent upstream errors raise LLMError after max_retries + 1 attempts"""
+    stub_server.statuses = [502, 502, 502]
+    client = make_client(stub_server, max_retries=2)
+    with pytest.raises(LLMError):
+        client.complete("Hello")
+    assert stub_server.calls == 3
+
+def test_client_errors_are_not_retried(stub_server):
+    """4xx responses other than 429 fail immediately"""
+    stub_server.statuses = [401]
+    client = make_client(stub_server, max_retries=3)
+    with pytest.raises(LLMError):
+        client.complete("Hello")
+    assert stub_server.calls == 1
+
+def test_read_timeout(stub_server):
+    """A stalled upstream raises instead of blocking forever"""
+    stub_server.delay = 0.5
+    client = make_client(stub_server, read_timeout=0.1, max_retries=0)
+    with pytest.raises(LLMError):
+        client.complete("Hello")
+
+def test_stream_yields_deltas(stub_server):
+    """Streamed completions yield each delta and skip keep-alive comments"""
+    stub_server.statuses = [503]
+    client = make_client(stub_server, max_retries=1)
+    assert list(client.stream("Hello")) == ["stub ", "analysis"]
+    assert stub_server.calls == 2
+
+def test_stream_releases_slot_while_backing_off(stub_server):
+    """A stream waiting to retry does not keep other requests from running"""
+    stub_server.statuses = [503]
+    client = make_client(stub_server, max_retries=1, max_concurrency=1)
+    client._backoff_delay = lambda attempt, retry_after=None: 0.5
+    finished = []
+    
+    def consume():
+        list(client.stream("Hello"))
+        finished.append("stream")
+    thread = threading.Thread(target=consume)
+    thread.start()
+    time.sleep(0.2)
+    assert client.complete("Hello") == "stub analysis"
+    finished.append("complete")
+    thread.join()
+    
+    assert finished == ["complete", "stream"]
+    # Exhausted streams give their slot back
+    assert client._semaphore.acquire(blocking=False)
@@ -0,0 +1,35 @@
+import pytest
+import llm_stub_server
+from llm_client import LLMClient, LLMError
+
+@pytest.fixture
+def stub():
+    servers = []
+    def start(**kwargs):
+        server = llm_stub_server.start_server(seed=0, **kwargs)
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_completion_matches_the_chat_completions_format(stub):
+    server = stub(completion_tokens=5)
+    client = LLMClient("test-key", api_url=server.url, model="stub-model")
+    assert client.complete("Hello").split() == ["Compliance", "Score:", "72%", "The"]
+    assert server.requests == 1
+
+def test_streaming_yields_every_token(stub):
+    server = stub(completion_tokens=30, tokens_per_second=1000)
+    client = LLMClient("test-key", api_url=server.url)
+    tokens = list(client.stream("Hello"))
+    assert len(tokens) == 30
+    assert "".join(tokens).startswith("Compliance Score: 72%")
+
+def test_injected_errors_are_retried_then_raised(stub):
+    server = stub(error_rate=1.0, error_status=503)
+    client = LLMClient("test-key", api_url=server.url, max_retries=2, backoff_base=0.01)
+    with pytest.raises(LLMError):
+        client.complete("Hello")
+    assert server.errors == 3
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+import metrics
+from cache import LRUCache
+
+def test_render_prometheus_text():
+    registry = metrics.Registry()
+    counter = registry.counter("test_requests_total", "Requests", ("endpoint",))
+    histogram = registry.histogram("test_latency_seconds", "Latency", buckets=(0.1, 1))
+    counter.inc(endpoint='say "hi"')
+    counter.inc(2, endpoint='say "hi"')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{endpoint="say \\"hi\\""} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "test_latency_seconds_count 2" in text
+
+def test_timed_records_stage_for_the_current_request():
+    before = metrics.stage_seconds.count(stage="test_stage")
+    metrics.start_request()
+    with metrics.timed("test_stage"):
+        time.sleep(0.01)
+    assert metrics.stage_seconds.count(stage="test_stage") == before + 1
+    assert metrics.request_stages()["test_stage"] >= 0.01
+
+def test_bound_workers_record_stages_for_the_request():
+    """Stages timed in executor threads count towards the request that bound them"""
+    def work(_):
+        with metrics.timed("test_worker_stage"):
+            time.sleep(0.01)
+    
+    metrics.start_request()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(work, range(2)))
+    assert "test_worker_stage" not in metrics.request_stages()
+    
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(metrics.bind(work), range(4)))
+    assert metrics.request_stages()["test_worker_stage"] >= 0.04
+    
+    # Stages of another request are not affected
+    metrics.start_request()
+    assert metrics.request_stages() == {}
+
+def test_registered_cache_stats_are_exported():
+    cache = LRUCache(max_entries=2)
+    metrics.register_cache("test_cache", cache)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    text = metrics.registry.render()
+    assert 'satim_cache_hits_total{cache="test_cache"} 1' in text
+    assert 'satim_cache_misses_total{cache="test_cache"} 1' in text
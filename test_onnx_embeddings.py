@@ -0,0 +1,11 @@
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from onnx_embeddings import PARITY_THRESHOLD, parity_check
+
+def test_onnx_embeddings_match_pytorch():
+    report = parity_check(repeats=1)
+    assert report["min_cosine"] >= PARITY_THRESHOLD
+    assert report["passed"]
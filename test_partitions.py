@@ -0,0 +1,98 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from partitions import detect_language, document_family, normalize_filters
+from retrieval import Retriever
+from sparse_index import BM25Index
+from test_context_assembly import KeywordEmbeddings
+
+CATALOG = {
+    "Loi_18-07_fr.pdf": {"language": "fr", "family": "loi-18-07", "chunk_ids": ["Loi_18-07_fr.pdf:0"]},
+    "Access-Control-Policy.docx.pdf": {
+        "language": "en", "family": "access-control",
+        "chunk_ids": ["Access-Control-Policy.docx.pdf:0", "Access-Control-Policy.docx.pdf:1"],
+    },
+    "Encryption-Standard.docx.pdf": {
+        "language": "en", "family": "encryption", "chunk_ids": ["Encryption-Standard.docx.pdf:0"],
+    },
+}
+
+def make_retriever(sparse=False):
+    texts = {
+        "Loi_18-07_fr.pdf:0": "password audit des données",
+        "Access-Control-Policy.docx.pdf:0": "password rules for accounts",
+        "Access-Control-Policy.docx.pdf:1": "network access audit",
+        "Encryption-Standard.docx.pdf:0": "password encryption password",
+    }
+    ids = list(texts)
+    docs = [Document(page_content=texts[i], metadata={"source": i.split(":")[0]}) for i in ids]
+    vectordb = FAISS.from_documents(docs, KeywordEmbeddings(), ids=ids)
+    sparse_index = BM25Index.build(ids, [texts[i] for i in ids]) if sparse else None
+    return Retriever(vectordb, f"partitions-{sparse}", sparse_index, CATALOG)
+
+def test_language_and_family_from_file_names_and_text():
+    assert detect_language("data/global/Loi_18-07_fr.pdf") == "fr"
+    assert detect_language("Policy.pdf", "The user shall change the password and the PIN") == "en"
+    assert detect_language("Referentiel.pdf", "Les données sont protégées par le responsable et la loi") == "fr"
+    assert detect_language("Empty.pdf") is None
+    assert document_family("Access-Control-Policy.docx.pdf") == "access-control"
+    assert document_family("Loi_18-07_fr.pdf") == "loi-18-07"
+    assert document_family("Patch-Management-Standard.docx.pdf") == "patch-management"
+
+def test_normalize_filters():
+    assert normalize_filters(None) is None
+    assert normalize_filters({"source": "", "family": []}) is None
+    assert normalize_filters({"family": "access-control, encryption"}) == {"family": ["access-control", "encryption"]}
+    for bad in ({"source": 3}, {"family": {"name": "x"}}, {"language": ["fr", None]}, "Loi", {"year": "2020"}):
+        with pytest.raises(ValueError):
+            normalize_filters(bad)
+
+def test_filters_route_to_matching_partitions():
+    retriever = make_retriever()
+    partitions = retriever.partitions
+    assert partitions.matching_files({"source": "Loi 18-07"}) == ("Loi_18-07_fr.pdf",)
+    assert partitions.matching_files({"language": "en", "family": ["Access-Control", "encryption"]}) == (
+        "Access-Control-Policy.docx.pdf", "Encryption-Standard.docx.pdf")
+    assert partitions.matching_files({"language": ["en", "fr"]}) is None
+
+    ids = retriever.batch_search_ids(["password"], k=3, filters={"family": "access-control"})[0]
+    assert ids[0] == "Access-Control-Policy.docx.pdf:0"
+    assert all(doc_id.startswith("Access-Control") for doc_id in ids)
+    assert retriever.similarity_search("password", k=2, filters={"source": "missing"}) == []
+
+    docs = retriever.similarity_search("password", k=1, filters={"language": "fr"})
+    assert docs[0].metadata["source"] == "Loi_18-07_fr.pdf"
+
+def test_hybrid_search_respects_filters():
+    retriever = make_retriever(sparse=True)
+    ids = retriever.batch_search_ids(["audit"], k=4, filters={"language": "en"})[0]
+    assert ids and not any(doc_id.startswith("Loi") for doc_id in ids)
+
+def test_chunk_shared_by_filtered_files_is_returned_once():
+    texts = {"A.pdf:0": "password password rules", "A.pdf:1": "network audit", "B.pdf:1": "password encryption"}
+    ids = list(texts)
+    docs = [Document(page_content=texts[i], metadata={"source": i.split(":")[0]}) for i in ids]
+    vectordb = FAISS.from_documents(docs, KeywordEmbeddings(), ids=ids)
+    # A.pdf:0 was kept for a near-duplicate chunk of B.pdf at dedup time
+    catalog = {
+        "A.pdf": {"language": "en", "family": "a", "chunk_ids": ["A.pdf:0", "A.pdf:1"]},
+        "B.pdf": {"language": "en", "family": "b", "chunk_ids": ["A.pdf:0", "B.pdf:1"]},
+        "C_fr.pdf": {"language": "fr", "family": "c", "chunk_ids": []},
+    }
+    for sparse_index in (None, BM25Index.build(ids, [texts[i] for i in ids])):
+        retriever = Retriever(vectordb, f"shared-{sparse_index is None}", sparse_index, catalog)
+        found = retriever.batch_search_ids(["password"], k=3, filters={"language": "en"})[0]
+        assert sorted(found) == ["A.pdf:0", "A.pdf:1", "B.pdf:1"]
+
+def test_filtered_search_runs_on_compact_indexes(tmp_path):
+    from index_storage import load_compact, save_compact
+    from test_context_assembly import KeywordEmbeddings as Embeddings
+    vectordb = make_retriever().vectordb
+    for index_type in ("sq8", "ivf"):
+        path = str(tmp_path / index_type)
+        save_compact(vectordb, path, index_type)
+        retriever = Retriever(load_compact(path, Embeddings(), index_type), f"compact-{index_type}", None, CATALOG)
+        ids = retriever.batch_search_ids(["password"], k=3, filters={"language": "en"})[0]
+        assert ids[0] == "Access-Control-Policy.docx.pdf:0"
+        assert sorted(ids) == ["Access-Control-Policy.docx.pdf:0", "Access-Control-Policy.docx.pdf:1",
+                               "Encryption-Standard.docx.pdf:0"]
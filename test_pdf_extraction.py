@@ -0,0 +1,33 @@
+import io
+import os
+import pdf_extraction
+
+PDF = os.path.join("data", "internal", "Encryption-Standard.docx.pdf")
+
+def test_page_ranges_match_serial_extraction(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_extraction, "PDF_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(pdf_extraction, "PAGES_PER_TASK", 1)
+    serial = pdf_extraction._extract_page_range(PDF, 0, pdf_extraction._page_count(PDF))
+    parallel = pdf_extraction.extract_pages([PDF], workers=2)[PDF]
+    assert parallel == serial
+
+def test_unchanged_pdfs_are_served_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_extraction, "PDF_CACHE_DIR", str(tmp_path))
+    first = pdf_extraction.extract_pages([PDF], workers=1)[PDF]
+    
+    def fail(*args):
+        raise AssertionError("cached PDF was parsed again")
+    monkeypatch.setattr(pdf_extraction, "_extract_page_range", fail)
+    monkeypatch.setattr(pdf_extraction, "_page_count", fail)
+    assert pdf_extraction.extract_pages([PDF], workers=1)[PDF] == first
+
+def test_unreadable_pdf_is_left_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_extraction, "PDF_CACHE_DIR", str(tmp_path / "cache"))
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    assert pdf_extraction.extract_pages([str(broken)], workers=1) == {}
+
+def test_pages_can_be_read_from_a_stream():
+    with open(PDF, "rb") as f:
+        from_stream = list(pdf_extraction.iter_page_texts(io.BytesIO(f.read())))
+    assert from_stream == list(pdf_extraction.iter_page_texts(PDF))
@@ -0,0 +1,33 @@
+from sparse_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "Article 38 : le responsable du traitement notifie la violation de données.",
+    "Access control policy: accounts are reviewed quarterly (CIS 5.3).",
+    "Backups are encrypted and tested every month.",
+]
+IDS = ["loi.pdf:0", "policy.pdf:0", "policy.pdf:1"]
+
+def test_tokenize_keeps_references_and_strips_accents():
+    assert tokenize("Loi 18-07, CIS 5.3 Données") == ["loi", "18-07", "cis", "5.3", "donnees"]
+
+def test_search_finds_exact_references():
+    index = BM25Index.build(IDS, TEXTS)
+    assert index.search("CIS 5.3", k=1)[0][0] == "policy.pdf:0"
+    assert index.search("article 38", k=1)[0][0] == "loi.pdf:0"
+    assert index.search("donnees", k=3)[0][0] == "loi.pdf:0"
+
+def test_search_skips_unmatched_documents():
+    index = BM25Index.build(IDS, TEXTS)
+    assert index.search("unknown term", k=3) == []
+
+def test_save_and_load_roundtrip(tmp_path):
+    index = BM25Index.build(IDS, TEXTS)
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("backups encrypted", k=2) == index.search("backups encrypted", k=2)
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+
+def test_reciprocal_rank_fusion_favours_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "a"]])
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c", "d"}
@@ -1,65 +1,98 @@
 from langchain.prompts import PromptTemplate
-import requests
-from datetime import datetime
-
-# Constants
-API_URL = 'https://openrouter.ai/api/v1/chat/completions'
-
-class UseCaseAnalyzer:
-    def __init__(self, api_key):
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "HTTP-Referer": "https://localhost:5000",
-            "Content-Type": "application/json"
-        }
+import re
+from retrieval import Retriever
+from context_assembly import ContextAssembler
+from base_analyzer import BaseAnalyzer, unique_items, PROMPT_TOKENS
+from utils import count_tokens
+import metrics
+from llm_client import API_URL, LLM_MODEL
+
+# CIS v8 controls offered in the UI, by the ids the frontend uses
+CIS_CONTROLS = {
+    "cis_1_1": "1.1 - Inventory and Control of Enterprise Assets",
+    "cis_1_2": "1.2 - Inventory and Control of Software Assets",
+    "cis_1_3": "1.3 - Data Protection",
+    "cis_1_4": "1.4 - Secure Configuration of Enterprise Assets and Software",
+    "cis_1_5": "1.5 - Account Management",
+    "cis_2_1": "2.1 - Email and Web Browser Protections",
+    "cis_2_2": "2.2 - Malware Defenses",
+    "cis_2_3": "2.3 - Data Recovery Capabilities",
+    "cis_2_4": "2.4 - Secure Configuration of Network Infrastructure",
+    "cis_2_5": "2.5 - Boundary Defense",
+    "cis_3_1": "3.1 - Security Skills Assessment and Training",
+    "cis_3_2": "3.2 - Application Software Security",
+    "cis_3_3": "3.3 - Incident Response Management",
+    "cis_3_4": "3.4 - Penetration Testing",
+    "cis_3_5": "3.5 - Audit Log Management"
+}
+
+# Same patterns the frontend uses to find the score in an analysis
+SCORE_PATTERNS = [
+    re.compile(r'Compliance Score:?\s*(\d+)%', re.IGNORECASE),
+    re.compile(r'Score de Conformité\s*:?\s*(\d+)%', re.IGNORECASE),
+    re.compile(r'(\d+)%\s*compliance', re.IGNORECASE),
+    re.compile(r'(\d+)%\s*conformité', re.IGNORECASE)
+]
+
+def parse_compliance_score(analysis):
+    """Extract the compliance score (0-100) from an analysis, or None if absent"""
+    for pattern in SCORE_PATTERNS:
+        match = pattern.search(analysis or "")
+        if match:
+            score = int(match.group(1))
+            if 0 <= score <= 100:
+                return score
+    return None
+
+class UseCaseAnalyzer(BaseAnalyzer):
+    def __init__(self, api_key, response_cache=None, llm_client=None, api_url=API_URL, model=LLM_MODEL):
+        super().__init__(api_key, response_cache=response_cache, llm_client=llm_client,
+                         api_url=api_url, model=model)
         self.internal_db = None
+        self.internal_retriever = None
+        self.internal_context = None
 
-    def query_llm(self, prompt, language='en'):
-        """Query the LLM through OpenRouter API"""
-        try:
-            payload = {
-                "model": "mistralai/mistral-7b-instruct",
-                "messages": [{"role": "user", "content": prompt}]
-            }
-            
-            response = requests.post(API_URL, headers=self.headers, json=payload)
-            response.raise_for_status()
-            
-            return response.json()['choices'][0]['message']['content']
-        except Exception as e:
-            print(f"Error querying LLM: {str(e)}")
-            return None
-
-    def set_internal_db(self, internal_db):
-        """Set the internal policy database"""
+    def set_internal_db(self, internal_db, version=None, sparse_index=None, catalog=None):
+        """Set the internal policy database
+        
+        Args:
+            internal_db: The FAISS store of internal policies
+            version (str): Fingerprint of the store, used to key cached search results
+            sparse_index: BM25 index of the store, enables hybrid retrieval
+            catalog (dict): Language, family and chunk ids of every file, used to
+                route filtered searches
+        """
         self.internal_db = internal_db
+        self.internal_retriever = Retriever(internal_db, version, sparse_index, catalog)
+        self.internal_context = ContextAssembler(self.internal_retriever)
 
-    def analyze_use_case(self, use_case, language='en'):
-        """Analyze a use case against internal policies and return KPIs
+    def _build_use_case_prompt(self, use_case, language='en', relevant_internals=None, filters=None):
+        """Retrieve the relevant internal policies and format the use case prompt
         
-        Args:
-            use_case (str): The use case to analyze (either CIS control ID or custom use case)
-            language (str): The language for the analysis ('en' or 'fr')
-            
-        Returns:
-            dict: Analysis report containing KPIs and comparison results
+        relevant_internals (chunks from the context assembler) may be passed in
+        when retrieval was already done in a batch. filters restricts the
+        internal policies searched, e.g. {"family": ["access-control"]}.
         """
-        try:
-            if not self.internal_db:
-                raise ValueError("Internal database not initialized. Call set_internal_db first.")
-
-            # Get relevant internal policies
-            relevant_internals = self.internal_db.similarity_search(
-                use_case, 
-                k=5
-            )
-            
-            # Construct analysis prompt
-            context = "\n".join([doc.page_content for doc in relevant_internals])
-            
-            # Create use case specific prompt
-            use_case_prompt = f"""
-            Analyze the following use case: {use_case}
+        if not self.internal_db:
+            raise ValueError("Internal database not initialized. Call set_internal_db first.")
+
+        # Get relevant internal policies
+        if relevant_internals is None:
+            relevant_internals = self.internal_context.select([use_case], filters)[0]
+        
+        # Pack them into what the rest of the prompt leaves of the budget
+        with metrics.timed("prompt_format"):
+            overhead = count_tokens(self._format_use_case_prompt(use_case, "", language))
+            context = self.internal_context.pack(relevant_internals, PROMPT_TOKENS - overhead)
+            return self._format_use_case_prompt(use_case, context, language)
+
+    def _format_use_case_prompt(self, use_case, context, language='en'):
+        """Format the use case prompt around the retrieved internal policies"""
+        use_case_prompt = f"""
+        Analyze the following use case: {use_case}
+
+Relevant internal policies (cite them by their [n] number):
+{context}
 
 Provide a structured analysis comparing the use case to internal policies, focusing on the following KPIs. Format the response with clear sections, using bullet points or tables for readability, and ensure all metrics are actionable and prioritized.
 
@@ -85,11 +118,14 @@ Provide a structured analysis comparing the use case to internal policies, focus
    - Suggest actionable improvements to address gaps
 
 IMPORTANT: Always start the Compliance Score section with "Compliance Score: X%" where X is a number between 0 and 100.
-            """
-            
-            if language == 'fr':
-                use_case_prompt = f"""
-                Analysez le cas d'usage suivant : {use_case}
+        """
+        
+        if language == 'fr':
+            use_case_prompt = f"""
+            Analysez le cas d'usage suivant : {use_case}
+
+Politiques internes pertinentes (citez-les par leur numéro [n]) :
+{context}
 
 Fournissez une analyse structurée comparant le cas d'usage aux politiques internes, en vous concentrant sur les KPI suivants. Formatez la réponse avec des sections claires, en utilisant des listes à puces ou des tableaux pour une meilleure lisibilité.
 
@@ -115,24 +151,84 @@ Fournissez une analyse structurée comparant le cas d'usage aux politiques inter
    - Suggérez des améliorations exploitables pour combler ces écarts
 
 IMPORTANT : Commencez toujours la section Score de Conformité par "Score de Conformité : X%" où X est un nombre entre 0 et 100.
-                """
-            
-            # Get analysis from LLM
-            llm_response = self.query_llm(use_case_prompt, language)
+            """
+        
+        return use_case_prompt
+
+    def analyze_use_case(self, use_case, language='en', filters=None):
+        """Analyze a use case against internal policies and return KPIs
+        
+        Args:
+            use_case (str): The use case to analyze (either CIS control ID or custom use case)
+            language (str): The language for the analysis ('en' or 'fr')
+            filters (dict): Only search internal policies matching these
+                source/language/family values
             
-            return self._format_analysis_report(llm_response)
+        Returns:
+            dict: Analysis report containing KPIs and comparison results
+        """
+        try:
+            use_case_prompt = self._build_use_case_prompt(use_case, language, filters=filters)
+            return self._run_analysis(use_case_prompt, language)
             
         except Exception as e:
             print(f"Error in use case analysis: {str(e)}")
             return None
 
-    def _format_analysis_report(self, llm_response):
-        """Format the analysis report in a structured way"""
-        if not llm_response:
-            return None
-            
-        return {
-            "analysis": llm_response,
-            "timestamp": datetime.now().isoformat(),
-            "status": "completed"
-        } 
\ No newline at end of file
+    def analyze_use_cases(self, use_cases, language='en', filters=None):
+        """Analyze several use cases (CIS control ids or custom use cases)
+        
+        Duplicates are analyzed once, the internal policies for all use cases
+        are retrieved in a single batched search, and the LLM calls run with
+        bounded concurrency.
+        
+        Returns:
+            dict: Per-item reports with their compliance score, plus a summary
+        """
+        if not self.internal_db:
+            raise ValueError("Internal database not initialized. Call set_internal_db first.")
+        
+        resolved = [CIS_CONTROLS.get(use_case, use_case) for use_case in use_cases]
+        unique = unique_items(resolved)
+        retrieved = dict(zip(unique, self.internal_context.select(unique, filters)))
+        
+        def analyze(use_case):
+            prompt = self._build_use_case_prompt(use_case, language, relevant_internals=retrieved.get(use_case),
+                                                 filters=filters)
+            return self._run_analysis(prompt, language)
+        
+        reports = self._analyze_batch(resolved, analyze)
+        
+        items = []
+        for use_case, report in zip(resolved, reports):
+            score = parse_compliance_score(report["analysis"]) if report else None
+            items.append({
+                "use_case": use_case,
+                "result": report,
+                "compliance_score": score,
+                "status": "completed" if report else "failed"
+            })
+        
+        scores = [item["compliance_score"] for item in items if item["compliance_score"] is not None]
+        summary = {
+            "total": len(items),
+            "completed": sum(1 for item in items if item["result"]),
+            "failed": sum(1 for item in items if not item["result"]),
+            "average_compliance_score": round(sum(scores) / len(scores), 1) if scores else None,
+            "min_compliance_score": min(scores) if scores else None,
+            "max_compliance_score": max(scores) if scores else None
+        }
+        return {"items": items, "summary": summary}
+
+    def stream_use_case(self, use_case, language='en', filters=None):
+        """Stream the analysis of a use case
+        
+        Yields ("token", text) events followed by ("done", report) or ("error", message)
+        """
+        try:
+            use_case_prompt = self._build_use_case_prompt(use_case, language, filters=filters)
+        except Exception as e:
+            print(f"Error in use case analysis: {str(e)}")
+            yield "error", "Failed to analyze use case"
+            return
+        yield from self._stream_analysis(use_case_prompt, language)
\ No newline at end of file
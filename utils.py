@@ -1,35 +1,118 @@
 # utils.py
 
-from langchain_community.document_loaders import PyPDFLoader
+from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 import os
 from dotenv import load_dotenv
 import re
+import json
+import hashlib
+from collections import Counter
+from embeddings import EMBEDDING_BACKEND, EMBEDDING_MODEL, get_embedding_service
+from gap_analysis import COVERAGE_FILE, build_coverage_index, load_coverage_index, save_coverage_index
+from index_storage import INDEX_TYPE, INDEX_TYPES, load_compact, save_compact
+from sparse_index import BM25Index
+from pdf_extraction import extract_pages, file_sha256
+from partitions import FILTER_KEYS, detect_language, document_family
+from chunking import STRUCTURE_MAX_CHARS, structure_split_documents
+from dedup import DEDUP_THRESHOLD, chunk_files, dedupe_chunks, save_dedup_report
 
 load_dotenv()
 
-def load_documents(directory):
+# Index settings; a stored index is only reused if it was built with these
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 100
+# "structure" chunks along articles/sections (see chunking.py), "recursive"
+# cuts fixed CHUNK_SIZE windows with CHUNK_OVERLAP
+CHUNKER = os.getenv("CHUNKER", "structure")
+CHUNKERS = ("structure", "recursive")
+VECTORSTORE_DIR = "vectorstores"
+MANIFEST_FILE = "manifest.json"
+
+def load_documents(directory, fnames=None):
     """
     Loads PDF documents from the specified directory
-    Returns a list of Document objects
+    If fnames is given, only those files are loaded
+    Files are parsed in parallel and their text cached by content hash
+    Returns a list of Document objects, one per page, with the source path,
+    page, file language and document family as metadata
     """
+    paths = [os.path.join(directory, fname) for fname in sorted(os.listdir(directory))
+             if fname.endswith(".pdf") and (fnames is None or fname in fnames)]
+    
     docs = []
-    for fname in os.listdir(directory):
-        if fname.endswith(".pdf"):
-            try:
-                loader = PyPDFLoader(os.path.join(directory, fname))
-                docs.extend(loader.load())
-                print(f"Successfully loaded: {fname}")
-            except Exception as e:
-                print(f"Error loading {fname}: {str(e)}")
+    extracted = extract_pages(paths)
+    for path in paths:
+        if path in extracted:
+            pages = extracted[path]
+            language = detect_language(path, "\n".join(pages))
+            family = document_family(path)
+            docs.extend(
+                Document(page_content=text, metadata={
+                    "source": path, "page": page, "language": language, "family": family
+                })
+                for page, text in enumerate(pages)
+            )
+            print(f"Successfully loaded: {os.path.basename(path)}")
     
     if not docs:
         print("No PDF documents found in the directory")
     
     return docs
 
+# Conservative characters-per-token ratio for English/French text
+CHARS_PER_TOKEN = 3
+
+# Optional Hugging Face tokenizer of the LLM (e.g. mistralai/Mistral-7B-Instruct-v0.2);
+# without it, token counts are estimated from the text length
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER")
+_tokenizer = None
+_tokenizer_loaded = False
+
+def get_tokenizer():
+    """
+    Returns the LLM_TOKENIZER tokenizer, loaded once, or None if it is not
+    configured or cannot be loaded
+    """
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if LLM_TOKENIZER:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(LLM_TOKENIZER)
+            except Exception as e:
+                print(f"Error loading tokenizer {LLM_TOKENIZER}, estimating token counts: {str(e)}")
+    return _tokenizer
+
+def count_tokens(text):
+    """
+    Counts the LLM tokens in a text, or estimates them without a tokenizer
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text or "", add_special_tokens=False))
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Cuts a text down to roughly max_tokens tokens, at a word boundary if possible
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return tokenizer.decode(ids[:max(max_tokens, 0)])
+    
+    max_chars = max(max_tokens, 0) * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return cut[:space] if space > max_chars // 2 else cut
+
 def preprocess_text(text):
     """
     Preprocesses the text by:
@@ -49,34 +132,340 @@ def preprocess_text(text):
     
     return text.strip()
 
+def split_documents(docs):
+    """
+    Splits documents into chunks with the configured CHUNKER and gives every
+    chunk an id of the form "<source file>:<n>" so its vectors can be traced
+    back to the file
+    Near-duplicate chunks are then collapsed into one (see dedup.py)
+    Returns the chunks and their ids
+    """
+    if CHUNKER not in CHUNKERS:
+        raise ValueError(f"Unknown CHUNKER {CHUNKER}, expected one of {CHUNKERS}")
+    if CHUNKER == "structure":
+        split_docs = structure_split_documents(docs)
+    else:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        split_docs = splitter.split_documents(docs)
+    
+    counters = {}
+    ids = []
+    for doc in split_docs:
+        fname = os.path.basename(doc.metadata.get("source", ""))
+        n = counters.get(fname, 0)
+        counters[fname] = n + 1
+        ids.append(f"{fname}:{n}")
+    
+    split_docs, ids, merges = dedupe_chunks(split_docs, ids)
+    if merges:
+        merged = sum(len(merge["merged"]) for merge in merges)
+        print(f"Merged {merged} near-duplicate chunk(s) into {len(merges)}")
+    return split_docs, ids
+
+def ids_by_file(ids, docs=None):
+    """
+    Groups chunk ids by the source file they were created from
+    Given the chunks, a chunk kept for merged duplicates is also listed
+    under the files of its copies
+    """
+    grouped = {}
+    for i, chunk_id in enumerate(ids):
+        files = chunk_files(chunk_id, docs[i].metadata) if docs is not None else [chunk_id.rsplit(":", 1)[0]]
+        for fname in files:
+            grouped.setdefault(fname, []).append(chunk_id)
+    return grouped
+
+def record_files(entries, docs, split_docs, ids):
+    """
+    Fills the manifest entries of files with their chunk ids, language and family
+    """
+    grouped = ids_by_file(ids, split_docs)
+    described = describe_files(docs)
+    for fname, entry in entries.items():
+        entry["chunk_ids"] = grouped.get(fname, [])
+        entry.update(described.get(fname, {}))
+
 def chunk_and_embed(docs, db_name):
     """
     Chunks documents and creates embeddings using free HuggingFace model
     """
     try:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
-        split_docs = splitter.split_documents(docs)
+        split_docs, ids = split_documents(docs)
         
         if not split_docs:
             raise ValueError("No documents to embed after splitting")
 
-        # Replace OpenAI with HuggingFace embeddings
-        model_name = "all-MiniLM-L6-v2"
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-        
-        vectordb = FAISS.from_documents(split_docs, embeddings)
-        vectordb.save_local(f"vectorstores/{db_name}")
-        return vectordb
+        # Shared HuggingFace embedding model, loaded once per process
+        vectordb = FAISS.from_documents(split_docs, get_embedding_service(), ids=ids)
+        save_vector_store(vectordb, db_name)
+        return load_vector_store(db_name) if INDEX_TYPE != "flat" else vectordb
     except Exception as e:
         raise Exception(f"Error in chunking and embedding: {str(e)}")
 
 def create_vector_store(docs, is_public=True):
     """
     Creates either a public or private vector store
+    Its manifest is rewritten to describe the documents it was built from, so
+    update_vector_store never mistakes it for a store of other files
     """
     db_name = "public_db" if is_public else "private_db"
     
     # Create directory if it doesn't exist
-    os.makedirs("vectorstores", exist_ok=True)
+    os.makedirs(VECTORSTORE_DIR, exist_ok=True)
+    
+    vectordb = chunk_and_embed(docs, db_name)
+    paths = {os.path.basename(doc.metadata.get("source", "")): doc.metadata.get("source") for doc in docs}
+    manifest = {
+        "config": index_config(),
+        "files": {fname: {"sha256": file_sha256(path)} for fname, path in sorted(paths.items())},
+    }
+    ids = list(vectordb.index_to_docstore_id.values())
+    record_files(manifest["files"], docs, [vectordb.docstore.search(chunk_id) for chunk_id in ids], ids)
+    save_manifest(db_name, manifest)
+    return vectordb
+
+def save_vector_store(vectordb, db_name):
+    """
+    Writes a vector store in the format selected by VECTOR_INDEX_TYPE
+    """
+    if INDEX_TYPE not in INDEX_TYPES:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE {INDEX_TYPE}, expected one of {INDEX_TYPES}")
+    db_path = os.path.join(VECTORSTORE_DIR, db_name)
+    if INDEX_TYPE == "flat":
+        vectordb.save_local(db_path)
+    else:
+        save_compact(vectordb, db_path, INDEX_TYPE)
+    build_sparse_index(vectordb).save(db_path)
+    save_dedup_report(vectordb, db_path)
+
+def load_vector_store(db_name, writable=False):
+    """
+    Loads a vector store written by save_vector_store
+    Compact stores are memory-mapped read-only unless writable is True
+    """
+    db_path = os.path.join(VECTORSTORE_DIR, db_name)
+    if INDEX_TYPE == "flat":
+        return FAISS.load_local(db_path, get_embedding_service())
+    return load_compact(db_path, get_embedding_service(), INDEX_TYPE, writable=writable)
+
+def build_sparse_index(vectordb):
+    """
+    Builds the BM25 keyword index over every chunk of a vector store
+    """
+    ids = list(vectordb.index_to_docstore_id.values())
+    texts = [vectordb.docstore.search(chunk_id).page_content for chunk_id in ids]
+    return BM25Index.build(ids, texts)
+
+def load_sparse_index(db_name):
+    """
+    Loads the BM25 index stored next to a vector store, or None if missing
+    """
+    return BM25Index.load(os.path.join(VECTORSTORE_DIR, db_name))
+
+def index_config():
+    """
+    Returns the chunking and embedding settings an index is built with
+    """
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunker": CHUNKER,
+        "structure_max_chars": STRUCTURE_MAX_CHARS,
+        "dedup_threshold": DEDUP_THRESHOLD,
+        "index_type": INDEX_TYPE,
+        "metadata": ["page", "article_id"] + list(FILTER_KEYS),
+    }
+
+def describe_files(docs):
+    """
+    Per-file metadata (language, family) of loaded documents, as stored in
+    the manifest to route filtered searches
+    """
+    files = {}
+    for doc in docs:
+        fname = os.path.basename(doc.metadata.get("source", ""))
+        files.setdefault(fname, {
+            "language": doc.metadata.get("language"),
+            "family": doc.metadata.get("family"),
+        })
+    return files
+
+def load_catalog(db_name):
+    """
+    The files of a stored vector store with their language, family and
+    chunk ids, or None if there is no manifest
+    """
+    manifest = load_manifest(db_name)
+    if manifest is None:
+        return None
+    return {
+        fname: {
+            "language": entry.get("language"),
+            "family": entry.get("family", document_family(fname)),
+            "chunk_ids": entry.get("chunk_ids", []),
+        }
+        for fname, entry in manifest.get("files", {}).items()
+    }
+
+def build_manifest(directory):
+    """
+    Describes the current state of a document directory: the index config
+    plus a content hash for every PDF in it
+    """
+    files = {}
+    for fname in sorted(os.listdir(directory)):
+        if fname.endswith(".pdf"):
+            files[fname] = {"sha256": file_sha256(os.path.join(directory, fname))}
+    return {"config": index_config(), "files": files}
+
+def load_manifest(db_name):
+    """
+    Loads the manifest stored next to a vector store, or None if missing
+    """
+    path = os.path.join(VECTORSTORE_DIR, db_name, MANIFEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_manifest(db_name, manifest):
+    """
+    Writes the manifest next to a vector store
+    """
+    path = os.path.join(VECTORSTORE_DIR, db_name, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def index_version(db_name):
+    """
+    Returns a fingerprint of the stored manifest, which changes whenever the
+    vector store is rebuilt or updated, or None if there is no manifest
+    """
+    manifest = load_manifest(db_name)
+    if manifest is None:
+        return None
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def coverage_version():
+    """
+    Fingerprint of the pair of stores a coverage index is built from
+    """
+    return f"{index_version('public_db')}:{index_version('private_db')}"
+
+def update_coverage_index(global_db, internal_db):
+    """
+    Loads the precomputed global -> internal coverage index, rebuilding and
+    saving it first if either vector store changed since it was built
+    """
+    path = os.path.join(VECTORSTORE_DIR, COVERAGE_FILE)
+    version = coverage_version()
+    entries = load_coverage_index(path, version)
+    if entries is None:
+        print("Building coverage index")
+        entries = build_coverage_index(global_db, internal_db)
+        save_coverage_index(path, entries, version)
+    return entries
+
+def _load_stored_vector_store(db_name, manifest, stored):
+    """
+    Loads a stored vector store if it can be updated in place to match the
+    manifest, i.e. it was built with the same config and tracks its chunk ids
+    """
+    db_path = os.path.join(VECTORSTORE_DIR, db_name)
+    if not stored or stored.get("config") != manifest["config"]:
+        return None
+    if any("chunk_ids" not in entry for entry in stored.get("files", {}).values()):
+        return None
+    if not os.path.exists(os.path.join(db_path, "index.faiss")):
+        return None
+    
+    try:
+        return load_vector_store(db_name)
+    except Exception as e:
+        print(f"Error loading {db_name}, rebuilding: {str(e)}")
+        return None
+
+def update_vector_store(directory, is_public=True, rebuild=False):
+    """
+    Brings the stored vector store in line with the PDFs in the directory:
+    - unchanged store: loaded from disk as is
+    - new or modified PDFs: only those are chunked and embedded
+    - modified or deleted PDFs: their old vectors are removed
+    The store is rebuilt from scratch if the index config changed, nothing
+    usable is stored yet, or rebuild is True
+    """
+    db_name = "public_db" if is_public else "private_db"
+    manifest = build_manifest(directory)
+    stored = load_manifest(db_name)
+    vectordb = None if rebuild else _load_stored_vector_store(db_name, manifest, stored)
+    
+    if vectordb is None:
+        print(f"Building {db_name} from {directory}")
+        docs = load_documents(directory)
+        vectordb = create_vector_store(docs, is_public=is_public)
+        # Files that could not be read are tracked too, with no chunks
+        built = load_manifest(db_name)["files"]
+        for fname, entry in manifest["files"].items():
+            entry.update(built.get(fname, {"chunk_ids": []}))
+        save_manifest(db_name, manifest)
+        return vectordb
+    
+    stored_files = stored["files"]
+    current_files = manifest["files"]
+    removed = [f for f in stored_files
+               if f not in current_files or stored_files[f]["sha256"] != current_files[f]["sha256"]]
+    added = [f for f in current_files
+             if f not in stored_files or stored_files[f]["sha256"] != current_files[f]["sha256"]]
+    
+    # Files sharing a merged chunk with a changed file are re-indexed with it,
+    # so the chunk is rebuilt with the right sources and no id is reused
+    shared_ids = {chunk_id for f in removed for chunk_id in stored_files[f]["chunk_ids"]}
+    sharing = [f for f in stored_files if f not in removed and shared_ids & set(stored_files[f]["chunk_ids"])]
+    while sharing:
+        removed.extend(sharing)
+        added.extend(f for f in sharing if f in current_files and f not in added)
+        shared_ids.update(chunk_id for f in sharing for chunk_id in stored_files[f]["chunk_ids"])
+        sharing = [f for f in stored_files if f not in removed and shared_ids & set(stored_files[f]["chunk_ids"])]
+    
+    for fname in current_files:
+        if fname not in added:
+            current_files[fname] = dict(stored_files[fname])
+    
+    if not removed and not added:
+        print(f"Loaded {db_name} from disk")
+        # Stores written before keyword search existed get their BM25 index now
+        if load_sparse_index(db_name) is None:
+            build_sparse_index(vectordb).save(os.path.join(VECTORSTORE_DIR, db_name))
+        return vectordb
+    
+    # Compact stores are opened read-only for serving; load an updatable copy
+    if INDEX_TYPE != "flat":
+        vectordb = load_vector_store(db_name, writable=True)
+    
+    # A vector goes once no remaining file refers to it
+    present_ids = set(vectordb.index_to_docstore_id.values())
+    refcounts = Counter(chunk_id for f in stored_files if f not in removed
+                        for chunk_id in stored_files[f]["chunk_ids"])
+    stale_ids = list(dict.fromkeys(
+        chunk_id for f in removed for chunk_id in stored_files[f]["chunk_ids"]
+        if chunk_id in present_ids and not refcounts[chunk_id]
+    ))
+    if stale_ids:
+        vectordb.delete(stale_ids)
+    
+    if added:
+        docs = load_documents(directory, fnames=set(added))
+        split_docs, ids = split_documents(docs)
+        if split_docs:
+            vectordb.add_documents(split_docs, ids=ids)
+        record_files({fname: current_files[fname] for fname in added}, docs, split_docs, ids)
     
-    return chunk_and_embed(docs, db_name)
\ No newline at end of file
+    save_vector_store(vectordb, db_name)
+    save_manifest(db_name, manifest)
+    print(f"Updated {db_name}: {len(added)} file(s) indexed, {len(removed)} file(s) removed")
+    return load_vector_store(db_name) if INDEX_TYPE != "flat" else vectordb
\ No newline at end of file